@@ -0,0 +1,102 @@
+"""Range query latency on price_records before and after the composite index
+
+Usage: python benchmarks/bench_price_index.py [--rows 10000000] [--url sqlite:///bench.db]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--products', type=int, default=100)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--url', default='sqlite:///bench_price_index.db')
+    return parser.parse_args()
+
+def populate(engine, db, n_rows: int, n_products: int, chunk: int = 200_000):
+    """Insert n_rows of 5-minute ticks spread over n_products"""
+    from sqlalchemy import insert
+
+    with engine.begin() as conn:
+        conn.execute(insert(db.Product), [
+            {'id': i + 1, 'name': f"Product {i + 1}"} for i in range(n_products)
+        ])
+
+    per_product = n_rows // n_products
+    start = datetime(2020, 1, 1)
+    rng = np.random.default_rng(0)
+    for offset in range(0, n_rows, chunk):
+        idx = np.arange(offset, min(offset + chunk, n_rows))
+        product_ids = idx // per_product % n_products + 1
+        ticks = idx % per_product
+        prices = rng.uniform(1, 5, size=len(idx)).round(2)
+        rows = [
+            {'product_id': int(pid), 'timestamp': start + timedelta(minutes=5 * int(t)),
+             'price': float(p)}
+            for pid, t, p in zip(product_ids, ticks, prices)
+        ]
+        with engine.begin() as conn:
+            conn.execute(insert(db.PriceRecord), rows)
+    return start, per_product
+
+def time_queries(session, price_history, n_products, start, per_product, days, n_queries):
+    """Median latency of get_price_history-style range queries"""
+    rng = np.random.default_rng(1)
+    span = timedelta(minutes=5 * per_product)
+    timings = []
+    for _ in range(n_queries):
+        product = f"Product {rng.integers(1, n_products + 1)}"
+        window_start = start + span * rng.uniform(0, 0.8)
+        began = time.perf_counter()
+        price_history.load_price_history(
+            session, product, start_date=window_start,
+            end_date=window_start + timedelta(days=days)
+        )
+        timings.append(time.perf_counter() - began)
+    return float(np.median(timings)) * 1000
+
+def main():
+    args = parse_args()
+    os.environ['DATABASE_URL'] = args.url
+    from sqlalchemy import text
+    from utils import database as db
+    from utils import price_history
+
+    db.Base.metadata.drop_all(bind=db.engine)
+    db.Base.metadata.create_all(bind=db.engine)
+    with db.engine.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS uq_price_records_product_timestamp"))
+
+    began = time.perf_counter()
+    start, per_product = populate(db.engine, db, args.rows, args.products)
+    print(f"Inserted {args.rows:,} rows in {time.perf_counter() - began:.1f}s")
+
+    session = db.SessionLocal()
+    before = time_queries(session, price_history, args.products, start,
+                          per_product, args.days, args.queries)
+    session.close()
+
+    began = time.perf_counter()
+    db.migrate()
+    print(f"Built composite index in {time.perf_counter() - began:.1f}s")
+
+    session = db.SessionLocal()
+    after = time_queries(session, price_history, args.products, start,
+                         per_product, args.days, args.queries)
+    session.close()
+
+    print(f"{args.days}-day range query, median of {args.queries}:")
+    print(f"  without index: {before:9.2f} ms")
+    print(f"  with index:    {after:9.2f} ms")
+    print(f"  speedup:       {before / after:9.1f}x")
+
+if __name__ == '__main__':
+    main()
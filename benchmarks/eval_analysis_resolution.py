@@ -0,0 +1,88 @@
+"""Label agreement vs latency of classifier features at reduced analysis sizes
+
+Runs _classify_product and _assess_quality on every image in a directory at
+the full preprocessed size and at each candidate size, and reports how often
+the product and quality labels match the full-size result. Disease is left
+out because _assess_quality samples it at random.
+
+Usage: python benchmarks/eval_analysis_resolution.py IMAGE_DIR [--sizes 512 384 256 192 128]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+def load_images(directory: str) -> list:
+    from utils.image_processor import preprocess_image
+    images = []
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        try:
+            with open(os.path.join(directory, name), 'rb') as f:
+                images.append((name, preprocess_image(f)))
+        except Exception as e:
+            print(f"Skipping {name}: {str(e)}")
+    return images
+
+def labels_at(classifier, images: list, repeats: int = 3) -> tuple:
+    """(product, quality) per image and best-of-repeats ms per image"""
+    from utils.image_processor import ProcessedImage
+    best = float('inf')
+    for _ in range(repeats):
+        # Fresh containers so downscaling and array caching are timed too
+        fresh = [ProcessedImage(image.image) for _, image in images]
+        began = time.perf_counter()
+        labels = []
+        for image in fresh:
+            features = classifier._extract_features(image)
+            product = classifier._classify_product(features)
+            quality, _, _ = classifier._assess_quality(features)
+            labels.append((product, quality))
+        best = min(best, (time.perf_counter() - began) / len(fresh))
+    return labels, best * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('image_dir')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[512, 384, 256, 192, 128])
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DATABASE_URL', 'sqlite:///bench_analysis_resolution.db')
+    from utils.mock_ml import MockClassifier
+
+    images = load_images(args.image_dir)
+    if not images:
+        print(f"No images found in {args.image_dir}")
+        return
+
+    baseline, baseline_ms = labels_at(MockClassifier(analysis_size=None), images, args.repeats)
+    full_side = max(max(image.size) for _, image in images)
+    print(f"{len(images)} images, full size up to {full_side}px, best of {args.repeats}")
+    print(f"{'size':>6} {'ms/image':>9} {'speedup':>8} {'product':>8} {'quality':>8} {'both':>6}")
+    print(f"{'full':>6} {baseline_ms:9.2f} {1.0:7.2f}x {100.0:7.1f}% {100.0:7.1f}% {100.0:5.1f}%")
+
+    for size in args.sizes:
+        labels, ms = labels_at(MockClassifier(analysis_size=size), images, args.repeats)
+        product = np.mean([a[0] == b[0] for a, b in zip(labels, baseline)]) * 100
+        quality = np.mean([a[1] == b[1] for a, b in zip(labels, baseline)]) * 100
+        both = np.mean([a == b for a, b in zip(labels, baseline)]) * 100
+        print(f"{size:>6} {ms:9.2f} {baseline_ms / ms:7.2f}x "
+              f"{product:7.1f}% {quality:7.1f}% {both:5.1f}%")
+
+        mismatches = [name for (name, _), a, b in zip(images, labels, baseline) if a != b]
+        if mismatches:
+            print(f"       changed: {', '.join(mismatches[:10])}"
+                  f"{' ...' if len(mismatches) > 10 else ''}")
+
+    print("Set ANALYSIS_SIZE to the smallest size that keeps agreement acceptable")
+
+if __name__ == '__main__':
+    main()
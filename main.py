@@ -7,6 +7,7 @@ import time
 import io
 
 # Import custom modules
+from utils.database import init_db
 from utils.image_processor import preprocess_image, enhance_image
 from utils.mock_ml import MockClassifier
 from utils.price_analyzer import PriceAnalyzer
@@ -23,13 +24,14 @@ st.set_page_config(
 with open('assets/style.css') as f:
     st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
 
-# Initialize session state
-if 'classifier' not in st.session_state:
-    st.session_state.classifier = MockClassifier()
-if 'price_analyzer' not in st.session_state:
-    st.session_state.price_analyzer = PriceAnalyzer()
-if 'price_predictor' not in st.session_state:
-    st.session_state.price_predictor = PricePredictor()
+# Services are created once per server process and shared by every session;
+# per-user state belongs in st.session_state
+@st.cache_resource
+def get_services():
+    init_db()
+    return MockClassifier(), PriceAnalyzer(), PricePredictor()
+
+classifier, price_analyzer, price_predictor = get_services()
 
 # Header
 st.title("🌾 Agricultural Product Analyzer")
@@ -69,7 +71,7 @@ with col1:
                         st.image(enhanced_image, caption="Uploaded Image", use_column_width=True)
 
                         # Analyze image
-                        results = st.session_state.classifier.analyze_image(image)
+                        results = classifier.analyze_image(image)
 
                         if results["product"] != "Unknown":
                             # Display results
@@ -85,7 +87,7 @@ with col1:
                                 st.metric("Confidence Score", f"{results['confidence']*100:.1f}%")
 
                             # Get price data for detected product
-                            price_data = st.session_state.price_analyzer.get_price_statistics(results['product'])
+                            price_data = price_analyzer.get_price_statistics(results['product'])
 
                             st.markdown("### Market Insights")
 
@@ -115,7 +117,7 @@ with col1:
                                 st.metric("Highest Price", f"${price_data['max_price']:.2f}/kg")
 
                             # Get real-time price data
-                            real_time_data = st.session_state.price_predictor.get_real_time_price(results['product'])
+                            real_time_data = price_predictor.get_real_time_price(results['product'])
 
                             # Real-time price updates
                             st.markdown("### Real-Time Market Data")
@@ -132,7 +134,7 @@ with col1:
                                 st.text(f"Last Updated: {real_time_data['update_time']}")
 
                             # Price predictions
-                            predictions = st.session_state.price_predictor.predict_price(results['product'])
+                            predictions = price_predictor.predict_price(results['product'])
 
                             st.markdown("### Price Predictions")
                             pred_col1, pred_col2 = st.columns(2)
@@ -187,7 +189,7 @@ with col2:
     if uploaded_file and results["product"] != "Unknown":
         try:
             # Get historical price data
-            historical_data = st.session_state.price_analyzer.get_price_history(
+            historical_data = price_analyzer.get_price_history(
                 results['product'], days=90
             )
 
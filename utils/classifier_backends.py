@@ -0,0 +1,178 @@
+import os
+import threading
+from abc import ABC, abstractmethod
+import numpy as np
+from .image_processor import as_processed
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+# Backend selection and ONNX Runtime settings, see create_backend
+CLASSIFIER_BACKEND = os.environ.get('CLASSIFIER_BACKEND', 'rules').lower()
+ONNX_MODEL_PATH = os.environ.get('ONNX_MODEL_PATH')
+ONNX_INTRA_OP_THREADS = int(os.environ.get('ONNX_INTRA_OP_THREADS', '0'))
+ONNX_INTER_OP_THREADS = int(os.environ.get('ONNX_INTER_OP_THREADS', '0'))
+ONNX_BATCH_SIZE = int(os.environ.get('ONNX_BATCH_SIZE', '16'))
+
+# ImageNet normalization, what most exported vision models expect
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+class ClassifierBackend(ABC):
+    """Turns decoded images into analyze_image result dicts"""
+    name = 'base'
+    batch_size = 1
+
+    @property
+    def cache_key(self) -> str:
+        """Identifies this backend's results among stored analyses"""
+        return self.name
+
+    @abstractmethod
+    def classify(self, images: list) -> list:
+        """Classify a list of images, one result dict per image"""
+
+class RuleBasedBackend(ClassifierBackend):
+    """Hand-written feature rules of MockClassifier"""
+    name = 'rules'
+
+    def __init__(self, classifier):
+        self.classifier = classifier
+
+    def classify(self, images: list) -> list:
+        return [self.classifier._classify_rules(image) for image in images]
+
+def get_onnx_session(model_path: str, intra_op_threads: int = 0,
+                     inter_op_threads: int = 0):
+    """Process-wide CPU inference session, created once per model and thread config"""
+    key = (os.path.abspath(model_path), intra_op_threads, inter_op_threads)
+    with _sessions_lock:
+        if key not in _sessions:
+            options = ort.SessionOptions()
+            # 0 lets ONNX Runtime pick based on the available cores
+            options.intra_op_num_threads = intra_op_threads
+            options.inter_op_num_threads = inter_op_threads
+            options.execution_mode = (
+                ort.ExecutionMode.ORT_PARALLEL if inter_op_threads > 1
+                else ort.ExecutionMode.ORT_SEQUENTIAL
+            )
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            _sessions[key] = ort.InferenceSession(
+                model_path, sess_options=options, providers=['CPUExecutionProvider']
+            )
+        return _sessions[key]
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return shifted / shifted.sum(axis=1, keepdims=True)
+
+class OnnxBackend(ClassifierBackend):
+    """ONNX Runtime CPU model with batched inference
+
+    The first model output holds product logits in the order of `products`.
+    Optional second and third outputs hold quality and disease logits; when
+    they are missing, quality and disease come from the `fallback` backend.
+    """
+    name = 'onnx'
+
+    def __init__(self, model_path: str, products: list, qualities: list,
+                 diseases: list, fallback: ClassifierBackend,
+                 intra_op_threads: int = ONNX_INTRA_OP_THREADS,
+                 inter_op_threads: int = ONNX_INTER_OP_THREADS,
+                 batch_size: int = ONNX_BATCH_SIZE, input_size: int = 224,
+                 mean: tuple = IMAGENET_MEAN, std: tuple = IMAGENET_STD):
+        if ort is None:
+            raise ImportError("onnxruntime is not installed")
+        self.session = get_onnx_session(model_path, intra_op_threads, inter_op_threads)
+        self.model_name = os.path.basename(model_path)
+        self.products = products
+        self.qualities = qualities
+        self.diseases = diseases
+        self.fallback = fallback
+        self.batch_size = batch_size
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        shape = model_input.shape
+        # Channels-first unless the model declares (N, H, W, 3)
+        self.channels_last = len(shape) == 4 and shape[3] == 3
+        spatial = shape[1:3] if self.channels_last else shape[2:4]
+        self.input_size = tuple(
+            dim if isinstance(dim, int) else input_size for dim in spatial
+        ) if len(shape) == 4 else (input_size, input_size)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.std = np.asarray(std, dtype=np.float32)
+
+    @property
+    def cache_key(self) -> str:
+        # A different model file classifies differently
+        return f"{self.name}:{self.model_name}"
+
+    def _to_tensor(self, images: list) -> np.ndarray:
+        """Resize and normalize images into one float32 batch"""
+        height, width = self.input_size
+        batch = np.stack([
+            np.asarray(as_processed(image).image.resize((width, height)), dtype=np.float32)
+            for image in images
+        ])
+        batch = (batch / 255.0 - self.mean) / self.std
+        if not self.channels_last:
+            batch = batch.transpose(0, 3, 1, 2)
+        return np.ascontiguousarray(batch, dtype=np.float32)
+
+    def classify(self, images: list) -> list:
+        results = []
+        for start in range(0, len(images), self.batch_size):
+            chunk = images[start:start + self.batch_size]
+            outputs = self.session.run(None, {self.input_name: self._to_tensor(chunk)})
+            product_probs = _softmax(outputs[0])
+
+            if len(outputs) >= 3:
+                quality_idx = outputs[1].argmax(axis=1)
+                disease_idx = outputs[2].argmax(axis=1)
+                assessed = [
+                    (self.qualities[q], self.diseases[d])
+                    for q, d in zip(quality_idx, disease_idx)
+                ]
+            else:
+                assessed = [
+                    (result["quality"], result["disease"])
+                    for result in self.fallback.classify(chunk)
+                ]
+
+            for probs, (quality, disease) in zip(product_probs, assessed):
+                best = int(probs.argmax())
+                results.append({
+                    "product": self.products[best],
+                    "quality": quality,
+                    "disease": disease,
+                    "confidence": float(probs[best])
+                })
+        return results
+
+def create_backend(classifier, name: str = None) -> ClassifierBackend:
+    """Configured backend for a classifier, falling back to the rule-based one"""
+    rules = RuleBasedBackend(classifier)
+    name = (name or CLASSIFIER_BACKEND).lower()
+    if name == 'rules':
+        return rules
+
+    if name == 'onnx':
+        try:
+            if not ONNX_MODEL_PATH:
+                raise ValueError("ONNX_MODEL_PATH is not set")
+            return OnnxBackend(
+                ONNX_MODEL_PATH, classifier.products, classifier.qualities,
+                classifier.diseases, fallback=rules
+            )
+        except Exception as e:
+            print(f"Error loading ONNX classifier, using rule-based backend: {str(e)}")
+            return rules
+
+    print(f"Unknown classifier backend '{name}', using rule-based backend")
+    return rules
@@ -1,6 +1,11 @@
 from datetime import datetime
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, JSON, Index, inspect, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 
@@ -9,11 +14,71 @@ DATABASE_URL = os.environ.get('DATABASE_URL')
 if DATABASE_URL and DATABASE_URL.startswith('postgres://'):
     DATABASE_URL = DATABASE_URL.replace('postgres://', 'postgresql://', 1)
 
-# Create database engine
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Optional monthly range partitioning of price_records (PostgreSQL only)
+PRICE_PARTITIONING = os.environ.get('PRICE_PARTITIONING', '').lower() in ('1', 'true', 'yes')
+PRICE_PARTITION_START = os.environ.get('PRICE_PARTITION_START', '2023-01-01')
+PRICE_PARTITION_MONTHS_AHEAD = int(os.environ.get('PRICE_PARTITION_MONTHS_AHEAD', '3'))
+PRICE_RETENTION_MONTHS = os.environ.get('PRICE_RETENTION_MONTHS')
+PRICE_PARTITION_MAINTENANCE_HOURS = float(os.environ.get('PRICE_PARTITION_MAINTENANCE_HOURS', '24'))
+
+# Connection pool shared by every session in the process (ignored for SQLite)
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', '1800'))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+
+# Dialects whose insert() supports on_conflict_do_update
+UPSERT_DIALECTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+# Tables of regenerable rows, which migrate() may dedupe for a new unique index
+DEDUPLICATE_ON_MIGRATE = {'model_states'}
+
+# Engine and schema are created on first use, see get_engine and init_db
+_engine = None
+_initialized = False
+_init_lock = threading.RLock()
+_maintenance_lock = threading.Lock()
+_last_maintenance = None  # time.monotonic() of the last maintain_partitions run
+_partition_months = set()  # Months whose partition is known to exist
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
 Base = declarative_base()
 
+def _engine_options(url: str) -> dict:
+    """Pool settings for server databases, SQLite keeps its default pool"""
+    if url and url.startswith('sqlite'):
+        return {}
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING
+    }
+
+def get_engine():
+    """Process-wide engine, created on first call"""
+    global _engine
+    if _engine is None:
+        with _init_lock:
+            if _engine is None:
+                _engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+                SessionLocal.configure(bind=_engine)
+    return _engine
+
+def __getattr__(name):
+    # Keep `database.engine` working without creating it at import time
+    if name == 'engine':
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _reset_after_fork():
+    # Pooled connections belong to the parent, children open their own
+    if _engine is not None:
+        _engine.dispose(close=False)
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
 class Product(Base):
     __tablename__ = "products"
     
@@ -32,9 +97,17 @@ class Analysis(Base):
     disease = Column(String)
     confidence = Column(Float)
     image_path = Column(String)
+    image_hash = Column(String, index=True)
+    # Classifier configuration the result came from, part of the dedupe key
+    backend = Column(String)
+    analysis_size = Column(Integer)
     
     product = relationship("Product", back_populates="analyses")
 
+    __table_args__ = (
+        Index("ix_analyses_product_timestamp", "product_id", "timestamp"),
+    )
+
 class PriceRecord(Base):
     __tablename__ = "price_records"
     
@@ -45,11 +118,341 @@ class PriceRecord(Base):
     
     product = relationship("Product", back_populates="price_records")
 
-# Create all tables
-Base.metadata.create_all(bind=engine)
+    __table_args__ = (
+        # Unique so ingestion can upsert on (product, timestamp)
+        Index("uq_price_records_product_timestamp", "product_id", "timestamp", unique=True),
+    )
+
+class ModelState(Base):
+    __tablename__ = "model_states"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), index=True)
+    model_type = Column(String)
+    params = Column(JSON)
+    n_obs = Column(Integer)
+    last_timestamp = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    product = relationship("Product")
+
+    __table_args__ = (
+        # One saved state per product and model, ModelStore upserts on it
+        Index("uq_model_states_product_model", "product_id", "model_type", unique=True),
+    )
+
+class PriceRollup(Base):
+    __tablename__ = "price_rollups"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"))
+    resolution = Column(String)
+    bucket = Column(DateTime)
+    open = Column(Float)
+    high = Column(Float)
+    low = Column(Float)
+    close = Column(Float)
+    count = Column(Integer)
+    first_timestamp = Column(DateTime)
+    last_timestamp = Column(DateTime)
+    
+    product = relationship("Product")
+
+    __table_args__ = (
+        Index("ix_price_rollups_product_resolution_bucket",
+              "product_id", "resolution", "bucket", unique=True),
+    )
+
+def migrate(bind=None):
+    """Add columns and indexes missing from tables created by older versions"""
+    bind = bind or get_engine()
+    # create_all skips existing tables entirely, so their new columns too
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    column_type = column.type.compile(dialect=bind.dialect)
+                    conn.execute(text(
+                        f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'
+                    ))
+
+    for table in Base.metadata.sorted_tables:
+        existed = inspector.has_table(table.name)
+        existing_indexes = (
+            {index['name'] for index in inspector.get_indexes(table.name)} if existed else set()
+        )
+        for index in table.indexes:
+            # Older saved models may hold rows a new unique index rejects, refits restore them
+            if (index.unique and existed and index.name not in existing_indexes
+                    and table.name in DEDUPLICATE_ON_MIGRATE):
+                with bind.begin() as conn:
+                    _deduplicate(conn, table.name, [column.name for column in index.columns])
+            try:
+                index.create(bind=bind, checkfirst=True)
+            except Exception as e:
+                # e.g. duplicate rows blocking a unique index, keep starting up
+                print(f"Error creating index {index.name}: {str(e)}")
+                if _fallback_index_name(index):
+                    _create_fallback_index(bind, index)
+                continue
+            fallback = _fallback_index_name(index)
+            if fallback in existing_indexes:
+                # The unique index serves the same lookups
+                _drop_index(bind, fallback)
+
+def _fallback_index_name(index: Index) -> str:
+    """ix_ name of a uq_ index's non-unique twin, None for other indexes"""
+    if index.unique and index.name.startswith('uq_'):
+        return 'ix_' + index.name[len('uq_'):]
+    return None
+
+def _drop_index(bind, name: str):
+    try:
+        with bind.begin() as conn:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        print(f"Dropped index {name}")
+    except Exception as e:
+        print(f"Error dropping index {name}: {str(e)}")
+
+def _create_fallback_index(bind, index: Index):
+    """Non-unique twin of a unique index that could not be built, keeps lookups indexed"""
+    name = _fallback_index_name(index)
+    try:
+        columns = ', '.join(f'"{column.name}"' for column in index.columns)
+        # Plain DDL, a second Index object would attach itself to the table metadata
+        with bind.begin() as conn:
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {name} ON {index.table.name} ({columns})"
+            ))
+        print(f"Created non-unique index {name} instead")
+    except Exception as e:
+        print(f"Error creating index {name}: {str(e)}")
+
+def has_unique_index(bind, table_name: str, columns: list) -> bool:
+    """Whether a unique index or constraint covers exactly these columns"""
+    inspector = inspect(bind)
+    keys = [index['column_names'] for index in inspector.get_indexes(table_name)
+            if index['unique']]
+    keys += [constraint['column_names']
+             for constraint in inspector.get_unique_constraints(table_name)]
+    return any(set(key) == set(columns) for key in keys)
+
+def _deduplicate(conn, table_name: str, columns: list) -> int:
+    """Delete all but the newest row per key, so a unique index can be built"""
+    key = ', '.join(f'"{column}"' for column in columns)
+    not_null = ' AND '.join(f'"{column}" IS NOT NULL' for column in columns)
+    deleted = conn.execute(text(
+        f"DELETE FROM {table_name} WHERE {not_null} AND id NOT IN ("
+        f"SELECT MAX(id) FROM {table_name} WHERE {not_null} GROUP BY {key})"
+    )).rowcount
+    if deleted:
+        print(f"Removed {deleted} duplicate rows from {table_name} on ({key})")
+    return deleted
+
+def partitioning_enabled(bind=None) -> bool:
+    """Whether price_records is stored as monthly partitions"""
+    bind = bind or get_engine()
+    return PRICE_PARTITIONING and bind.dialect.name == 'postgresql'
+
+def _month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+def _add_months(value: datetime, months: int) -> datetime:
+    month = value.month - 1 + months
+    return datetime(value.year + month // 12, month % 12 + 1, 1)
+
+def _to_datetime(value) -> datetime:
+    """Coerce dates, strings and pandas timestamps to datetime"""
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    if hasattr(value, 'to_pydatetime'):
+        return value.to_pydatetime()
+    return value
+
+def _partition_name(month: datetime) -> str:
+    return f"price_records_p{month:%Y%m}"
+
+def create_partitioned_price_records(bind=None):
+    """Create price_records as a table range-partitioned by month"""
+    bind = bind or get_engine()
+    Base.metadata.create_all(bind=bind, tables=[Product.__table__])
+    # Partition key must be part of the primary key, so the DDL is written by hand
+    with bind.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS price_records (
+                id SERIAL,
+                product_id INTEGER REFERENCES products (id),
+                "timestamp" TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+                price DOUBLE PRECISION,
+                PRIMARY KEY (id, "timestamp")
+            ) PARTITION BY RANGE ("timestamp")
+        """))
+
+def _existing_partitions(conn) -> list:
+    """Names of the partitions currently attached to price_records"""
+    return conn.execute(text("""
+        SELECT child.relname FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = 'price_records'
+    """)).scalars().all()
+
+def _create_partitions(conn, start: datetime, end: datetime):
+    partitioned = conn.execute(text("""
+        SELECT 1 FROM pg_partitioned_table
+        JOIN pg_class ON pg_class.oid = pg_partitioned_table.partrelid
+        WHERE pg_class.relname = 'price_records'
+    """)).first()
+    if partitioned is None:
+        print("price_records is not partitioned, recreate it to enable partitioning")
+        return
+
+    existing = set(_existing_partitions(conn))
+    month = start
+    while month <= end:
+        upper = _add_months(month, 1)
+        if _partition_name(month) not in existing:
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {_partition_name(month)} "
+                f"PARTITION OF price_records "
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{upper:%Y-%m-%d}')"
+            ))
+        month = upper
+
+def ensure_price_partitions(start=None, end=None, bind=None):
+    """Create any missing monthly partitions covering [start, end]"""
+    bind = bind or get_engine()
+    if not partitioning_enabled(bind):
+        return
+
+    start = _month_start(_to_datetime(start or PRICE_PARTITION_START))
+    end = _month_start(_to_datetime(end) if end is not None else
+                       _add_months(datetime.utcnow(), PRICE_PARTITION_MONTHS_AHEAD))
+
+    if isinstance(bind, Connection):
+        # Reuse the caller's transaction, e.g. a seeding session
+        _create_partitions(bind, start, end)
+    else:
+        with bind.begin() as conn:
+            _create_partitions(conn, start, end)
+
+def drop_price_partitions_before(cutoff: datetime, bind=None) -> list:
+    """Drop whole monthly partitions that end on or before cutoff"""
+    bind = bind or get_engine()
+    if not partitioning_enabled(bind):
+        return []
+
+    cutoff = _month_start(cutoff)
+    dropped = []
+    with bind.connect() as conn:
+        names = sorted(_existing_partitions(conn))
+        conn.rollback()  # Each drop below runs in its own short transaction
+        for name in names:
+            try:
+                month = datetime.strptime(name, "price_records_p%Y%m")
+            except ValueError:
+                continue
+            if _add_months(month, 1) > cutoff:
+                continue
+
+            # Dropping a partition is a metadata operation, no row deletes.
+            # It needs an exclusive lock on the parent, so give up rather than
+            # queue every reader behind a long-running transaction.
+            try:
+                with conn.begin():
+                    conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+                    conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                dropped.append(name)
+            except Exception as e:
+                print(f"Error dropping partition {name}: {str(e)}")
+    return dropped
+
+def maintain_partitions(bind=None):
+    """Pre-create upcoming partitions and apply the retention policy"""
+    bind = bind or get_engine()
+    if not partitioning_enabled(bind):
+        return
+    ensure_price_partitions(bind=bind)
+    if PRICE_RETENTION_MONTHS:
+        cutoff = _add_months(_month_start(datetime.utcnow()), -int(PRICE_RETENTION_MONTHS))
+        drop_price_partitions_before(cutoff, bind=bind)
+
+def ensure_partition_for(value, bind=None):
+    """Make sure the partition for value's month exists, checked once per month
+
+    Runs in its own transaction unless given a Connection, so the cache only
+    records partitions that were actually committed.
+    """
+    bind = bind or get_engine()
+    if not partitioning_enabled(bind):
+        return
+    month = _month_start(_to_datetime(value))
+    if month in _partition_months:
+        return
+    ensure_price_partitions(month, month, bind=bind)
+    if not isinstance(bind, Connection):
+        _partition_months.add(month)
+
+def maintain_partitions_if_due():
+    """Re-run maintain_partitions in long-lived processes once per interval"""
+    global _last_maintenance
+    if not partitioning_enabled():
+        return
+    interval = PRICE_PARTITION_MAINTENANCE_HOURS * 3600
+    with _maintenance_lock:
+        now = time.monotonic()
+        if _last_maintenance is not None and now - _last_maintenance < interval:
+            return
+        _last_maintenance = now
+    maintain_partitions()
+
+def init_db():
+    """Create tables, apply migrations and partition upkeep, once per process"""
+    global _initialized
+    if _initialized:
+        return get_engine()
+    with _init_lock:
+        if not _initialized:
+            engine = get_engine()
+            if partitioning_enabled(engine):
+                create_partitioned_price_records(engine)
+            Base.metadata.create_all(bind=engine)
+            migrate(engine)
+            maintain_partitions_if_due()
+            _initialized = True
+    return get_engine()
+
+@contextmanager
+def session_scope(session=None):
+    """Session for one operation, returned to the pool when the block exits
+
+    Commits on success and rolls back on error. An already open session is
+    passed through untouched, so nested helpers share the caller's session.
+    """
+    if session is not None:
+        yield session
+        return
+
+    init_db()
+    maintain_partitions_if_due()
+    session = SessionLocal()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
 
 def get_db():
     """Get database session"""
+    init_db()
+    maintain_partitions_if_due()
     db = SessionLocal()
     try:
         yield db
@@ -0,0 +1,166 @@
+import numpy as np
+
+HIST_BINS = 32
+GRAY_LEVELS = 3 * 255 + 1  # Possible values of R+G+B
+
+# Column layout of the feature matrix returned by extract_features_batch
+FEATURE_LAYOUT = {
+    'mean_color': slice(0, 3),
+    'std_color': slice(3, 6),
+    'hist_r': slice(6, 38),
+    'hist_g': slice(38, 70),
+    'hist_b': slice(70, 102),
+    'mean_gradient': 102,
+    'std_gradient': 103,
+    'entropy': 104,
+    'smoothness': 105,
+    'uniformity': 106,
+    'brightness': 107,
+    'contrast': 108,
+    'r_ratio': 109,
+    'g_ratio': 110,
+    'b_ratio': 111,
+    'color_variance': 112,
+    'color_std': 113
+}
+N_FEATURES = 114
+
+def histogram_bins(values: np.ndarray, lo: np.ndarray, hi: np.ndarray,
+                   bins: int = HIST_BINS) -> np.ndarray:
+    """Bin indices matching np.histogram(values, bins) over per-row [lo, hi]
+
+    values is (N, K) and lo/hi are (N, 1), one histogram range per row.
+    """
+    # np.histogram widens a zero-width range to [v - 0.5, v + 0.5]
+    flat = hi == lo
+    lo = np.where(flat, lo - 0.5, lo)
+    hi = np.where(flat, hi + 0.5, hi)
+    idx = ((values - lo) / (hi - lo) * bins).astype(np.intp)
+    idx = np.clip(idx, 0, bins - 1)
+
+    # Same edge corrections np.histogram applies for floating point rounding
+    edges = np.linspace(lo[:, 0], hi[:, 0], bins + 1, axis=1)
+    idx -= values < np.take_along_axis(edges, idx, axis=1)
+    idx += (values >= np.take_along_axis(edges, idx + 1, axis=1)) & (idx != bins - 1)
+    # Values outside [lo, hi] can be nudged past either end
+    return np.clip(idx, 0, bins - 1)
+
+def gray_statistics(gray_counts: np.ndarray, pixels: int) -> dict:
+    """Entropy, uniformity and smoothness from counts of gray*3 levels
+
+    gray_counts is (N, 766): how many pixels have R+G+B equal to each level,
+    i.e. an exact histogram of the channel-mean grayscale image.
+    """
+    n = len(gray_counts)
+    levels = np.arange(gray_counts.shape[1])
+    values = np.broadcast_to(levels / 3.0, gray_counts.shape)
+
+    # Gray range actually present in each image
+    present = gray_counts > 0
+    lo = (np.argmax(present, axis=1) / 3.0)[:, None]
+    hi = ((gray_counts.shape[1] - 1 - np.argmax(present[:, ::-1], axis=1)) / 3.0)[:, None]
+
+    # Map every level (not every pixel) to its 32-bin slot, then sum counts
+    idx = histogram_bins(values, lo, hi) + (np.arange(n) * HIST_BINS)[:, None]
+    hist = np.bincount(
+        idx.ravel(), weights=gray_counts.ravel(), minlength=n * HIST_BINS
+    ).reshape(n, HIST_BINS) / pixels
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_hist = np.where(hist > 0, np.log2(hist), 0.0)
+
+    mean = gray_counts @ (levels / 3.0) / pixels
+    var = np.maximum(gray_counts @ (levels / 3.0) ** 2 / pixels - mean ** 2, 0)
+
+    return {
+        'entropy': -np.sum(hist * log_hist, axis=1),
+        'uniformity': np.sum(np.square(hist), axis=1),
+        'smoothness': 1 - (1 / (1 + var))
+    }
+
+def extract_features_batch(images: np.ndarray) -> np.ndarray:
+    """Compute classifier features for an (N, H, W, 3) uint8 stack"""
+    images = np.asarray(images)
+    if images.ndim == 3:
+        images = images[None]
+    n, h, w, _ = images.shape
+    pixels = h * w
+
+    features = np.empty((n, N_FEATURES))
+    color_counts = np.empty((n, 3, 256))
+    gray_counts = np.empty((n, GRAY_LEVELS))
+    gradient_stats = np.empty((n, 2))
+
+    # One image at a time so temporaries stay a few image-sized buffers,
+    # bincount on the raw uint8/uint16 values needs no offset index arrays
+    for i, image in enumerate(images):
+        for c in range(3):
+            color_counts[i, c] = np.bincount(image[:, :, c].ravel(), minlength=256)
+
+        # R+G+B per pixel, i.e. three times the channel-mean grayscale
+        gray_sum = image.sum(axis=2, dtype=np.uint16)
+        gray_counts[i] = np.bincount(gray_sum.ravel(), minlength=GRAY_LEVELS)
+
+        # Gradient statistics on the float grayscale image
+        gray = gray_sum / 3.0
+        gradient_magnitude = np.hypot(np.gradient(gray, axis=1), np.gradient(gray, axis=0))
+        gradient_stats[i] = gradient_magnitude.mean(), gradient_magnitude.std()
+
+    # Color moments and 32-bin histograms straight from the exact histograms
+    levels = np.arange(256, dtype=np.float64)
+    mean_color = color_counts @ levels / pixels
+    std_color = np.sqrt(np.maximum(
+        color_counts @ levels ** 2 / pixels - mean_color ** 2, 0
+    ))
+    color_hist = color_counts.reshape(n, 3, HIST_BINS, 256 // HIST_BINS).sum(axis=3) / pixels
+
+    texture = gray_statistics(gray_counts, pixels)
+    total = mean_color.sum(axis=1, keepdims=True) + 1e-6
+
+    features[:, FEATURE_LAYOUT['mean_color']] = mean_color
+    features[:, FEATURE_LAYOUT['std_color']] = std_color
+    features[:, FEATURE_LAYOUT['hist_r']] = color_hist[:, 0]
+    features[:, FEATURE_LAYOUT['hist_g']] = color_hist[:, 1]
+    features[:, FEATURE_LAYOUT['hist_b']] = color_hist[:, 2]
+    features[:, FEATURE_LAYOUT['mean_gradient']] = gradient_stats[:, 0]
+    features[:, FEATURE_LAYOUT['std_gradient']] = gradient_stats[:, 1]
+    features[:, FEATURE_LAYOUT['entropy']] = texture['entropy']
+    features[:, FEATURE_LAYOUT['smoothness']] = texture['smoothness']
+    features[:, FEATURE_LAYOUT['uniformity']] = texture['uniformity']
+    features[:, FEATURE_LAYOUT['brightness']] = mean_color.mean(axis=1)
+    features[:, FEATURE_LAYOUT['contrast']] = std_color.mean(axis=1)
+    features[:, FEATURE_LAYOUT['r_ratio']] = mean_color[:, 0] / total[:, 0]
+    features[:, FEATURE_LAYOUT['g_ratio']] = mean_color[:, 1] / total[:, 0]
+    features[:, FEATURE_LAYOUT['b_ratio']] = mean_color[:, 2] / total[:, 0]
+    features[:, FEATURE_LAYOUT['color_variance']] = mean_color.var(axis=1)
+    features[:, FEATURE_LAYOUT['color_std']] = mean_color.std(axis=1)
+    return features
+
+def features_to_dict(row: np.ndarray) -> dict:
+    """Expand one feature matrix row into the dict used by MockClassifier"""
+    get = lambda name: row[FEATURE_LAYOUT[name]]
+    return {
+        'mean_color': get('mean_color'),
+        'std_color': get('std_color'),
+        'brightness': float(get('brightness')),
+        'contrast': float(get('contrast')),
+        'color_ratios': {
+            'r_ratio': float(get('r_ratio')),
+            'g_ratio': float(get('g_ratio')),
+            'b_ratio': float(get('b_ratio'))
+        },
+        'histograms': {
+            'r': get('hist_r'),
+            'g': get('hist_g'),
+            'b': get('hist_b')
+        },
+        'texture': {
+            'mean_gradient': float(get('mean_gradient')),
+            'std_gradient': float(get('std_gradient')),
+            'entropy': float(get('entropy')),
+            'smoothness': float(get('smoothness')),
+            'uniformity': float(get('uniformity'))
+        },
+        'color_variance': float(get('color_variance')),
+        'color_std': float(get('color_std'))
+    }
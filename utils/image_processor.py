@@ -1,32 +1,166 @@
 import cv2
+import hashlib
 import numpy as np
 from PIL import Image
 import io
+from functools import lru_cache
 
-def preprocess_image(uploaded_file) -> Image.Image:
+MAX_UPLOAD_PIXELS = 100_000_000  # 100 MP, larger than any phone camera
+
+# (alpha, beta) contrast/brightness pairs for enhance_image
+ENHANCEMENT_PRESETS = {
+    'default': (1.1, 10),
+    'none': (1.0, 0),
+    'bright': (1.2, 20),
+    'high_contrast': (1.3, -20)
+}
+
+def _hash_pixels(mode: str, size: tuple, buffer) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{mode}{size}".encode())
+    digest.update(buffer)
+    return digest.hexdigest()
+
+class ProcessedImage:
+    """Decoded RGB upload whose pixel buffers are materialized once and shared
+
+    Enhancement, display and feature extraction all read from the same
+    cached arrays instead of converting the PIL image again.
+    """
+
+    def __init__(self, image: Image.Image):
+        self.image = image if image.mode == 'RGB' else image.convert('RGB')
+        self._rgb = None
+        self._gray_sum = None
+        self._gray = None
+        self._content_hash = None
+        self._thumbnails = {}
+        self._downscaled = {}
+
+    @property
+    def size(self) -> tuple:
+        return self.image.size
+
+    @property
+    def rgb(self) -> np.ndarray:
+        """Read-only (H, W, 3) uint8 pixel array"""
+        if self._rgb is None:
+            self._rgb = np.asarray(self.image)
+            self._rgb.setflags(write=False)
+        return self._rgb
+
+    @property
+    def gray_sum(self) -> np.ndarray:
+        """R+G+B per pixel as uint16, three times the channel-mean grayscale"""
+        if self._gray_sum is None:
+            self._gray_sum = self.rgb.sum(axis=2, dtype=np.uint16)
+            self._gray_sum.setflags(write=False)
+        return self._gray_sum
+
+    @property
+    def gray(self) -> np.ndarray:
+        """Channel-mean grayscale as float64"""
+        if self._gray is None:
+            self._gray = self.gray_sum / 3.0
+            self._gray.setflags(write=False)
+        return self._gray
+
+    @property
+    def content_hash(self) -> str:
+        """Content hash of the decoded pixels"""
+        if self._content_hash is None:
+            self._content_hash = _hash_pixels(self.image.mode, self.image.size, self.rgb.data)
+        return self._content_hash
+
+    def thumbnail(self, size: tuple, resample=Image.LANCZOS) -> Image.Image:
+        """Downscaled copy for previews, cached per size"""
+        key = (tuple(size), resample)
+        if key not in self._thumbnails:
+            thumb = self.image.copy()
+            thumb.thumbnail(size, resample)
+            self._thumbnails[key] = thumb
+        return self._thumbnails[key]
+
+    def downscaled(self, max_side: int) -> 'ProcessedImage':
+        """Copy fitting within max_side x max_side, with its own cached buffers"""
+        if max_side is None or max(self.size) <= max_side:
+            return self
+        if max_side not in self._downscaled:
+            self._downscaled[max_side] = ProcessedImage(
+                self.thumbnail((max_side, max_side), Image.BOX)
+            )
+        return self._downscaled[max_side]
+
+def as_processed(image) -> ProcessedImage:
+    """Wrap a PIL image in a ProcessedImage, passing existing ones through"""
+    if isinstance(image, ProcessedImage):
+        return image
+    return ProcessedImage(image)
+
+def image_hash(image) -> str:
+    """Content hash of decoded pixels"""
+    if isinstance(image, ProcessedImage):
+        return image.content_hash
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return _hash_pixels(image.mode, image.size, image.tobytes())
+
+def open_upload(uploaded_file, max_pixels: int = MAX_UPLOAD_PIXELS) -> Image.Image:
+    """Open an upload lazily without copying it, rejecting huge dimensions"""
+    if isinstance(uploaded_file, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(uploaded_file)
+    elif hasattr(uploaded_file, 'seekable') and uploaded_file.seekable():
+        # Seekable file-likes (Streamlit uploads are BytesIO) are read in place
+        source = uploaded_file
+    else:
+        source = io.BytesIO(uploaded_file.read())
+
+    # Image.open only parses the header, so size is known before decoding
+    image = Image.open(source)
+    width, height = image.size
+    if width * height > max_pixels:
+        image.close()
+        raise ValueError(
+            f"Image dimensions {width}x{height} exceed the {max_pixels:,} pixel limit"
+        )
+    return image
+
+def preprocess_image(uploaded_file, max_size: tuple = (800, 800),
+                     resample=Image.LANCZOS, reducing_gap: float = 2.0,
+                     max_pixels: int = MAX_UPLOAD_PIXELS) -> ProcessedImage:
     """Preprocess uploaded image for analysis"""
-    # Read uploaded file
-    image_bytes = uploaded_file.read()
-    image = Image.open(io.BytesIO(image_bytes))
+    image = open_upload(uploaded_file, max_pixels)
+
+    # JPEGs decode straight at the largest 1/2, 1/4 or 1/8 DCT scale that still
+    # covers reducing_gap times the target, before anything loads full size
+    if image.format == 'JPEG':
+        image.draft('RGB', (int(max_size[0] * reducing_gap), int(max_size[1] * reducing_gap)))
     
     # Convert to RGB if necessary
     if image.mode != 'RGB':
         image = image.convert('RGB')
     
     # Resize image while maintaining aspect ratio
-    max_size = (800, 800)
-    image.thumbnail(max_size, Image.LANCZOS)
-    
-    return image
+    image.thumbnail(max_size, resample, reducing_gap=reducing_gap)
+
+    return ProcessedImage(image)
 
-def enhance_image(image: Image.Image) -> Image.Image:
+@lru_cache(maxsize=32)
+def _enhancement_lut(alpha: float, beta: float) -> tuple:
+    """256-entry table of cv2.convertScaleAbs applied to every uint8 value"""
+    levels = np.arange(256, dtype=np.uint8).reshape(1, 256)
+    return tuple(cv2.convertScaleAbs(levels, alpha=alpha, beta=beta).ravel().tolist())
+
+def enhance_image(image, alpha: float = None, beta: float = None,
+                  preset: str = 'default') -> Image.Image:
     """Enhance image for better visualization"""
-    # Convert PIL Image to OpenCV format
-    img_cv = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-    
-    # Apply basic enhancement
-    img_cv = cv2.convertScaleAbs(img_cv, alpha=1.1, beta=10)
-    
-    # Convert back to PIL Image
-    enhanced = Image.fromarray(cv2.cvtColor(img_cv, cv2.COLOR_BGR2RGB))
-    return enhanced
+    if isinstance(image, ProcessedImage):
+        image = image.image
+
+    preset_alpha, preset_beta = ENHANCEMENT_PRESETS[preset]
+    alpha = preset_alpha if alpha is None else alpha
+    beta = preset_beta if beta is None else beta
+
+    # Apply the same table to every band in one pass, no channel swaps or copies
+    lut = _enhancement_lut(float(alpha), float(beta))
+    return image.point(lut * len(image.getbands()))
@@ -1,23 +1,76 @@
+import os
+from functools import partial
 import numpy as np
 from PIL import Image
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from . import database as db
+from .feature_extractor import (
+    GRAY_LEVELS, extract_features_batch, features_to_dict, gray_statistics
+)
+from .cache import TTLCache
+from .classifier_backends import create_backend
+from .image_processor import ProcessedImage, as_processed, image_hash, preprocess_image
+
+UNKNOWN_RESULT = {
+    "product": "Unknown",
+    "quality": "Unknown",
+    "disease": "Unknown",
+    "confidence": 0.0
+}
+
+# Longest side features are computed at, unset keeps the preprocessed size
+ANALYSIS_SIZE = int(os.environ['ANALYSIS_SIZE']) if os.environ.get('ANALYSIS_SIZE') else None
+
+_worker_classifiers = {}
+
+def _load_image(source) -> Image.Image:
+    """Decode a path, bytes, file-like object or PIL image for analysis"""
+    if isinstance(source, (Image.Image, ProcessedImage)):
+        return as_processed(source)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return preprocess_image(f)
+    return preprocess_image(source)
+
+def _analyze_worker(source, analysis_size: int = ANALYSIS_SIZE) -> dict:
+    """Decode and classify one image in a pool worker, without touching the DB"""
+    if analysis_size not in _worker_classifiers:
+        _worker_classifiers[analysis_size] = MockClassifier(
+            analysis_size=analysis_size, backend='rules'
+        )
+    try:
+        image = _load_image(source)
+        result = _worker_classifiers[analysis_size]._classify_image(image)
+        return dict(result, error=None, image_hash=image_hash(image))
+    except Exception as e:
+        return dict(UNKNOWN_RESULT, error=str(e), image_hash=None)
 
 class MockClassifier:
-    def __init__(self):
+    def __init__(self, cache_size: int = 512, persistent_dedupe: bool = True,
+                 analysis_size: int = ANALYSIS_SIZE, backend: str = None):
         self.products = [
             "Tomatoes", "Potatoes", "Wheat", "Corn", 
             "Soybeans", "Rice", "Apples", "Oranges"
         ]
         self.qualities = ["Excellent", "Good", "Fair", "Poor"]
         self.diseases = ["Healthy", "Leaf Spot", "Blight", "Rust"]
-        self.db = next(db.get_db())
-
-    def _extract_features(self, image: Image.Image) -> dict:
+        # Results of already analyzed images, keyed by content hash and configuration
+        self.result_cache = TTLCache(maxsize=cache_size, ttl=None)
+        self.persistent_dedupe = persistent_dedupe
+        # Color ratios, histograms and gradients barely move when downscaled
+        self.analysis_size = analysis_size
+        # Rule tree below unless CLASSIFIER_BACKEND selects a model
+        self.backend = create_backend(self, backend)
+
+    def _extract_features(self, image) -> dict:
         """Extract detailed image features for crop classification"""
-        # Convert to numpy array and ensure RGB
-        img_array = np.array(image.convert('RGB'))
+        # Shared RGB array, decoded once per upload and analysis size
+        processed = as_processed(image).downscaled(self.analysis_size)
+        img_array = processed.rgb
 
         # Calculate color features
         mean_color = img_array.mean(axis=(0, 1))
@@ -34,7 +87,7 @@ class MockClassifier:
         hist_b = hist_b / hist_b.sum()
 
         # Calculate texture features using GLCM-like approach
-        texture_features = self._calculate_texture_features(img_array)
+        texture_features = self._calculate_texture_features(img_array, processed)
 
         # Calculate brightness and contrast
         brightness = mean_color.mean()
@@ -69,9 +122,19 @@ class MockClassifier:
             'color_std': color_std
         }
 
-    def _calculate_texture_features(self, img_array: np.ndarray) -> dict:
+    def _calculate_texture_features(self, img_array: np.ndarray,
+                                    processed: ProcessedImage = None) -> dict:
         """Calculate texture features from image"""
-        gray = np.mean(img_array, axis=2)  # Convert to grayscale
+        # R+G+B in integer arithmetic, three times the channel-mean grayscale
+        if processed is not None:
+            gray_sum, gray = processed.gray_sum, processed.gray
+        else:
+            gray_sum = img_array.sum(axis=2, dtype=np.uint16)
+            gray = gray_sum / 3.0
+
+        # One exact grayscale histogram feeds entropy, uniformity and smoothness
+        gray_counts = np.bincount(gray_sum.ravel(), minlength=GRAY_LEVELS)
+        gray_stats = gray_statistics(gray_counts[None].astype(np.float64), gray_sum.size)
 
         # Calculate gradients
         grad_x = np.gradient(gray, axis=1)
@@ -84,20 +147,13 @@ class MockClassifier:
         features = {
             'mean_gradient': np.mean(gradient_magnitude),
             'std_gradient': np.std(gradient_magnitude),
-            'entropy': self._calculate_entropy(gray),
-            'smoothness': 1 - (1 / (1 + np.std(gray)**2)),
-            'uniformity': np.sum(np.square(np.histogram(gray, bins=32)[0] / gray.size))
+            'entropy': float(gray_stats['entropy'][0]),
+            'smoothness': float(gray_stats['smoothness'][0]),
+            'uniformity': float(gray_stats['uniformity'][0])
         }
 
         return features
 
-    def _calculate_entropy(self, gray_image: np.ndarray) -> float:
-        """Calculate image entropy"""
-        histogram = np.histogram(gray_image, bins=32)[0]
-        histogram = histogram / histogram.sum()
-        non_zero = histogram > 0
-        return -np.sum(histogram[non_zero] * np.log2(histogram[non_zero]))
-
     def _classify_product(self, features: dict) -> str:
         """Enhanced crop classification based on image features"""
         try:
@@ -218,49 +274,232 @@ class MockClassifier:
             print(f"Error in quality assessment: {str(e)}")
             return "Unknown", "Unknown", 0.0
 
-    def analyze_image(self, image: Image.Image) -> dict:
-        """Analyze image using enhanced mock ML classification"""
+    def _classify_image(self, image) -> dict:
+        """Classify an image with the configured backend without persisting"""
+        return self._classify_images([image])[0][0]
+
+    def _classify_images(self, images: list) -> tuple:
+        """Classify with the configured backend, falling back to the rule tree
+
+        Returns the results and the cache key of the backend that produced them.
+        """
+        if self.backend.name == 'rules':
+            return [self._classify_rules(image) for image in images], self.backend.cache_key
         try:
-            # Extract image features
-            features = self._extract_features(image)
+            results = self.backend.classify(images)
+            if len(results) != len(images):
+                raise ValueError(f"expected {len(images)} results, got {len(results)}")
+            return results, self.backend.cache_key
+        except Exception as e:
+            print(f"Error in {self.backend.name} classification, using rules: {str(e)}")
+            return [self._classify_rules(image) for image in images], 'rules'
+
+    def _classify_rules(self, image) -> dict:
+        """Extract features and classify an image with the rule tree"""
+        # Extract image features
+        features = self._extract_features(image)
+
+        # Classify product and assess quality
+        product_name = self._classify_product(features)
+        quality, disease, confidence = self._assess_quality(features)
+
+        return {
+            "product": product_name,
+            "quality": quality,
+            "disease": disease,
+            "confidence": confidence
+        }
 
-            # Classify product and assess quality
+    def classify_batch(self, images: np.ndarray) -> list:
+        """Classify an (N, H, W, 3) stack of equal-size images without persisting"""
+        results = []
+        for row in extract_features_batch(images):
+            features = features_to_dict(row)
             product_name = self._classify_product(features)
             quality, disease, confidence = self._assess_quality(features)
-
-            if product_name != "Unknown":
-                # Save analysis to database
-                product = self.db.query(db.Product).filter(
-                    db.Product.name == product_name
-                ).first()
-
-                if not product:
-                    product = db.Product(name=product_name)
-                    self.db.add(product)
-                    self.db.commit()
-
-                analysis = db.Analysis(
-                    product_id=product.id,
-                    quality=quality,
-                    disease=disease,
-                    confidence=confidence,
-                    timestamp=datetime.utcnow()
-                )
-                self.db.add(analysis)
-                self.db.commit()
-
-            return {
+            results.append({
                 "product": product_name,
                 "quality": quality,
                 "disease": disease,
                 "confidence": confidence
+            })
+        return results
+
+    def _result_key(self, content_hash: str) -> tuple:
+        """Dedupe key, results differ between backends and analysis sizes"""
+        return (content_hash, self.backend.cache_key, self.analysis_size)
+
+    def _lookup_analysis(self, content_hash: str) -> dict:
+        """Find a previous result for an image, in memory or in the database"""
+        return self._lookup_analyses([content_hash]).get(content_hash)
+
+    def _lookup_analyses(self, content_hashes: list) -> dict:
+        """Previous results by content hash, from memory or one database query"""
+        found, missing = {}, []
+        for content_hash in set(content_hashes):
+            cached = self.result_cache.get(self._result_key(content_hash))
+            if cached is not None:
+                found[content_hash] = cached
+            else:
+                missing.append(content_hash)
+        if not missing or not self.persistent_dedupe:
+            return found
+
+        with db.session_scope() as session:
+            rows = session.query(
+                db.Analysis.image_hash, db.Product.name, db.Analysis.quality,
+                db.Analysis.disease, db.Analysis.confidence
+            ).join(db.Product).filter(
+                db.Analysis.image_hash.in_(missing),
+                db.Analysis.backend == self.backend.cache_key,
+                db.Analysis.analysis_size == self.analysis_size
+            ).order_by(db.Analysis.timestamp).all()
+
+        # Oldest first, so the latest analysis of each image wins
+        for row in rows:
+            found[row.image_hash] = {
+                "product": row.name,
+                "quality": row.quality,
+                "disease": row.disease,
+                "confidence": float(row.confidence)
             }
+        for content_hash in missing:
+            if content_hash in found:
+                self.result_cache.set(self._result_key(content_hash), found[content_hash])
+        return found
+
+    def _save_analyses(self, results: list, hashes: list = None, backend: str = None) -> None:
+        """Persist classified results as Analysis rows in one bulk insert
+
+        `backend` is the cache key of the backend that produced the results,
+        the configured one unless classification fell back to the rules.
+        """
+        backend = backend or self.backend.cache_key
+        hashes = hashes or [None] * len(results)
+        pairs = [(r, h) for r, h in zip(results, hashes) if r["product"] != "Unknown"]
+        if not pairs:
+            return
+
+        names = {r["product"] for r, _ in pairs}
+        with db.session_scope() as session:
+            product_ids = dict(session.query(db.Product.name, db.Product.id).filter(
+                db.Product.name.in_(names)
+            ).all())
+
+            missing = [db.Product(name=name) for name in names if name not in product_ids]
+            if missing:
+                session.add_all(missing)
+                session.flush()
+                product_ids.update({product.name: product.id for product in missing})
+
+            timestamp = datetime.utcnow()
+            session.execute(insert(db.Analysis), [{
+                'product_id': product_ids[r["product"]],
+                'quality': str(r["quality"]),
+                'disease': str(r["disease"]),
+                'confidence': float(r["confidence"]),
+                'image_hash': h,
+                'backend': backend,
+                'analysis_size': self.analysis_size,
+                'timestamp': timestamp
+            } for r, h in pairs])
+
+        if backend != self.backend.cache_key:
+            return
+        for r, h in pairs:
+            if h is not None:
+                self.result_cache.set(self._result_key(h), r)
+
+    def analyze_image(self, image) -> dict:
+        """Analyze image using enhanced mock ML classification"""
+        try:
+            # Re-uploads and Streamlit reruns reuse the earlier result
+            image = as_processed(image)
+            content_hash = image.content_hash
+            previous = self._lookup_analysis(content_hash)
+            if previous is not None:
+                return dict(previous)
+
+            results, backend = self._classify_images([image])
+            # Save analysis to database
+            self._save_analyses(results, [content_hash], backend)
+            return results[0]
 
         except Exception as e:
             print(f"Error analyzing image: {str(e)}")
-            return {
-                "product": "Unknown",
-                "quality": "Unknown",
-                "disease": "Unknown",
-                "confidence": 0.0
-            }
\ No newline at end of file
+            return dict(UNKNOWN_RESULT)
+
+    def _analyze_with_backend(self, sources: list) -> tuple:
+        """Decode sources and classify them in backend-sized batches
+
+        Returns the results and the cache key of the backend that produced them.
+        """
+        results, images, positions = [None] * len(sources), [], []
+        for i, source in enumerate(sources):
+            try:
+                image = _load_image(source)
+                images.append(image)
+                positions.append(i)
+            except Exception as e:
+                results[i] = dict(UNKNOWN_RESULT, error=str(e), image_hash=None)
+
+        classified, backend = self._classify_images(images)
+
+        for i, image, result in zip(positions, images, classified):
+            results[i] = dict(result, error=None, image_hash=image.content_hash)
+        return results, backend
+
+    def analyze_images(self, images, max_workers: int = None) -> list:
+        """Analyze many images in a process pool, returning results in input order
+
+        Each result carries an 'error' key that is None on success.
+        """
+        # Uploaded file objects don't pickle, hand their bytes to the workers
+        sources = [
+            source if isinstance(source, (str, os.PathLike, bytes, Image.Image, ProcessedImage))
+            else source.read()
+            for source in images
+        ]
+
+        backend = self.backend.cache_key
+        if self.backend.name != 'rules':
+            # Models batch and multithread internally, decode here and infer in batches
+            results, backend = self._analyze_with_backend(sources)
+        elif len(sources) > 1:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                chunksize = max(1, len(sources) // ((max_workers or os.cpu_count() or 1) * 4))
+                worker = partial(_analyze_worker, analysis_size=self.analysis_size)
+                results = list(pool.map(worker, sources, chunksize=chunksize))
+        else:
+            results = [_analyze_worker(source, self.analysis_size) for source in sources]
+
+        # Already analyzed images keep their earlier result and are not re-saved
+        hashes = [result.pop("image_hash") for result in results]
+        analyzed = [i for i, result in enumerate(results) if result["error"] is None]
+        try:
+            previous = self._lookup_analyses([hashes[i] for i in analyzed])
+        except SQLAlchemyError as e:
+            print(f"Error looking up previous analyses: {str(e)}")
+            previous = {}
+
+        new_positions = {}  # content hash -> positions of images not analyzed before
+        for i in analyzed:
+            if hashes[i] in previous:
+                results[i] = dict(previous[hashes[i]], error=None)
+            else:
+                new_positions.setdefault(hashes[i], []).append(i)
+
+        try:
+            self._save_analyses(
+                [{k: v for k, v in results[positions[0]].items() if k != "error"}
+                 for positions in new_positions.values()],
+                list(new_positions), backend
+            )
+        except SQLAlchemyError as e:
+            print(f"Error saving analyses: {str(e)}")
+            # Classified but not stored, callers see which images that affected
+            for positions in new_positions.values():
+                for i in positions:
+                    results[i]["error"] = f"Error saving analysis: {str(e)}"
+
+        return results
@@ -0,0 +1,73 @@
+from datetime import datetime
+from . import database as db
+
+class ModelStore:
+    """Persist fitted model parameters per product in the model_states table"""
+
+    def load(self, product: str, model_type: str, session=None) -> dict:
+        """Load the last saved state for a product's model, or None"""
+        try:
+            with db.session_scope(session) as session:
+                state = session.query(db.ModelState).join(db.Product).filter(
+                    db.Product.name == product,
+                    db.ModelState.model_type == model_type
+                ).order_by(db.ModelState.updated_at.desc()).first()
+
+                if not state:
+                    return None
+
+                return {
+                    'params': state.params,
+                    'n_obs': state.n_obs,
+                    'last_timestamp': state.last_timestamp
+                }
+        except Exception as e:
+            print(f"Error loading model state: {str(e)}")
+            return None
+
+    def save(self, product: str, model_type: str, params: dict,
+             n_obs: int, last_timestamp: datetime, session=None) -> None:
+        """Insert or replace the saved state for a product's model"""
+        try:
+            with db.session_scope(session) as session:
+                product_id = session.query(db.Product.id).filter(
+                    db.Product.name == product
+                ).scalar()
+                if product_id is None:
+                    return
+
+                values = {
+                    'product_id': product_id,
+                    'model_type': model_type,
+                    'params': params,
+                    'n_obs': int(n_obs),
+                    'last_timestamp': last_timestamp,
+                    'updated_at': datetime.utcnow()
+                }
+                dialect_insert = db.UPSERT_DIALECTS.get(session.get_bind().dialect.name)
+                if dialect_insert is not None:
+                    # Atomic, concurrent savers of the same model cannot both insert
+                    stmt = dialect_insert(db.ModelState).values(**values)
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=['product_id', 'model_type'],
+                        set_={name: stmt.excluded[name] for name in
+                              ('params', 'n_obs', 'last_timestamp', 'updated_at')}
+                    )
+                    session.execute(stmt)
+                    session.commit()
+                    return
+
+                state = session.query(db.ModelState).filter(
+                    db.ModelState.product_id == product_id,
+                    db.ModelState.model_type == model_type
+                ).first()
+
+                if not state:
+                    state = db.ModelState(product_id=product_id, model_type=model_type)
+                    session.add(state)
+
+                for name, value in values.items():
+                    setattr(state, name, value)
+                session.commit()
+        except Exception as e:
+            print(f"Error saving model state: {str(e)}")
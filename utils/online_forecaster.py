@@ -0,0 +1,41 @@
+import numpy as np
+
+class OnlineHoltWinters:
+    """Additive Holt-Winters state updated in O(1) per observation"""
+
+    def __init__(self, alpha: float = 0.3, beta: float = 0.05, gamma: float = 0.1,
+                 season_length: int = 288):
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.season_length = season_length  # 288 five-minute ticks per day
+        self.level = None
+        self.trend = 0.0
+        self.seasonal = np.zeros(season_length)
+        self.position = 0  # Seasonal slot of the next observation
+        self.n_obs = 0
+
+    def update(self, price: float) -> None:
+        """Fold one new observation into level, trend and seasonal state"""
+        price = float(price)
+        if self.level is None:
+            self.level = price
+        else:
+            season = self.seasonal[self.position]
+            prev_level = self.level
+            self.level = self.alpha * (price - season) + \
+                (1 - self.alpha) * (prev_level + self.trend)
+            self.trend = self.beta * (self.level - prev_level) + \
+                (1 - self.beta) * self.trend
+            self.seasonal[self.position] = self.gamma * (price - self.level) + \
+                (1 - self.gamma) * season
+
+        self.position = (self.position + 1) % self.season_length
+        self.n_obs += 1
+
+    def forecast(self, steps: int = 1) -> float:
+        """Forecast the value a number of observations ahead"""
+        if self.level is None:
+            return 0.0
+        season = self.seasonal[(self.position + steps - 1) % self.season_length]
+        return float(self.level + steps * self.trend + season)
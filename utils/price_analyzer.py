@@ -1,156 +1,189 @@
 import pandas as pd
-import numpy as np
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import case, func, select, true
 from . import database as db
+from . import price_export
+from . import price_history
+from . import price_rollups
+from . import price_seeder
+
+EMPTY_STATISTICS = {
+    'current_price': 0.0,
+    'average_price': 0.0,
+    'price_change': 0.0,
+    'min_price': 0.0,
+    'max_price': 0.0
+}
 
 class PriceAnalyzer:
     def __init__(self):
-        # Initialize database session
-        self.db = next(db.get_db())
+        # Sessions are opened per operation, see database.session_scope
         self._ensure_sample_data()
 
-    def _ensure_sample_data(self):
+    def _ensure_sample_data(self, start_date=price_seeder.DEFAULT_START_DATE,
+                            end_date=price_seeder.DEFAULT_END_DATE):
         """Ensure sample data exists in database"""
-        # Define realistic base prices and seasonal patterns for each product
-        product_configs = {
-            "Rice": {"base_price": 2.50, "seasonal_shift": 90, "volatility": 0.10},
-            "Wheat": {"base_price": 1.80, "seasonal_shift": 60, "volatility": 0.12},
-            "Corn": {"base_price": 1.50, "seasonal_shift": 30, "volatility": 0.15},
-            "Soybeans": {"base_price": 2.20, "seasonal_shift": 45, "volatility": 0.13},
-            "Tomatoes": {"base_price": 3.50, "seasonal_shift": 0, "volatility": 0.20},
-            "Potatoes": {"base_price": 1.20, "seasonal_shift": 120, "volatility": 0.15},
-            "Apples": {"base_price": 2.80, "seasonal_shift": 180, "volatility": 0.18},
-            "Oranges": {"base_price": 2.60, "seasonal_shift": 150, "volatility": 0.16}
-        }
-
-        for product_name, config in product_configs.items():
-            # Check if product exists
-            product = self.db.query(db.Product).filter(
-                db.Product.name == product_name
-            ).first()
-
-            if not product:
-                # Create new product
-                product = db.Product(name=product_name)
-                self.db.add(product)
-                self.db.commit()
-
-                # Generate price data with realistic patterns
-                base_price = float(config["base_price"])
-                seasonal_shift = config["seasonal_shift"]
-                volatility = config["volatility"]
-
-                dates = pd.date_range(start='2023-01-01', end='2023-12-31', freq='D')
-
-                for date in dates:
-                    # Add seasonal variation with product-specific patterns
-                    day_of_year = date.dayofyear
-                    seasonal = float(0.15 * np.sin(2 * np.pi * (day_of_year + seasonal_shift) / 365))
-
-                    # Add gradual market trend (slight upward bias)
-                    trend = float(0.05 * (date - dates[0]).days / 365)
-
-                    # Add controlled random noise
-                    noise = float(np.random.normal(0, volatility / 3))
-
-                    # Calculate final price with bounds
-                    price = base_price * (1 + seasonal + trend + noise)
-                    price = float(max(base_price * 0.7, min(base_price * 1.5, price)))
-
-                    price_record = db.PriceRecord(
-                        product_id=product.id,
-                        timestamp=date.to_pydatetime(),
-                        price=float(round(price, 2))
-                    )
-                    self.db.add(price_record)
-
-                self.db.commit()
+        try:
+            with db.session_scope() as session:
+                price_seeder.seed_products(
+                    session, price_seeder.PRODUCT_CONFIGS, start_date, end_date
+                )
+                # Databases from before rollups existed need a one-off build
+                price_rollups.backfill_missing(session)
+        except Exception as e:
+            print(f"Error seeding sample data: {str(e)}")
 
-    def get_price_history(self, product: str, days: int = 30) -> pd.DataFrame:
-        """Get historical price data for a product"""
+    def get_price_history(self, product: str, days: int = 30,
+                          max_points: int = price_rollups.DEFAULT_MAX_POINTS) -> pd.DataFrame:
+        """Get historical price data for a product, downsampled to max_points"""
         try:
             end_date = datetime.now()
             start_date = end_date - timedelta(days=days)
 
-            # Query price records
-            records = self.db.query(db.PriceRecord).join(db.Product).filter(
-                db.Product.name == product,
-                db.PriceRecord.timestamp >= start_date,
-                db.PriceRecord.timestamp <= end_date
-            ).order_by(db.PriceRecord.timestamp).all()
+            store = price_export.arrow_store()
+            df = store.load(product, start_date, end_date) if store else None
+            if df is not None:
+                df = self._downsample(df, start_date, end_date, max_points)
+            else:
+                df = self._load_history(product, start_date, end_date, max_points)
 
-            if not records:
+            if df.empty:
                 print(f"No price records found for {product}")
                 return pd.DataFrame(columns=['date', 'price'])
 
-            # Convert to DataFrame
-            data = [{
-                'date': record.timestamp,
-                'price': float(record.price)  # Ensure price is float
-            } for record in records]
-
-            return pd.DataFrame(data)
+            return df.rename(columns={'timestamp': 'date'})
         except Exception as e:
             print(f"Error getting price history: {str(e)}")
             return pd.DataFrame(columns=['date', 'price'])
 
+    def _load_history(self, product: str, start_date, end_date,
+                      max_points: int) -> pd.DataFrame:
+        """Load history from raw records or rollups, whichever fits max_points"""
+        with db.session_scope() as session:
+            # Serve long windows from hourly/daily rollups instead of raw ticks
+            raw_points = price_rollups.count_raw_points(session, product, start_date, end_date)
+            resolution = price_rollups.choose_resolution(
+                raw_points, start_date, end_date, max_points
+            )
+
+            if resolution == 'raw':
+                # Load (timestamp, price) columns straight into a DataFrame
+                df = price_history.load_price_history(
+                    session, product, start_date=start_date, end_date=end_date
+                )
+            else:
+                df = price_rollups.load_rollup_history(
+                    session, product, resolution, start_date, end_date
+                )
+        return df
+
+    def _downsample(self, df: pd.DataFrame, start_date, end_date,
+                    max_points: int) -> pd.DataFrame:
+        """Bucket in-memory history to closing prices like the rollup tables"""
+        resolution = price_rollups.choose_resolution(len(df), start_date, end_date, max_points)
+        if resolution == 'raw':
+            return df
+        closes = df.set_index('timestamp')['price'].resample(
+            price_rollups.RESOLUTIONS[resolution]
+        ).last().dropna()
+        return closes.reset_index()
+
+    def _latest_prices(self, product_id, window: int):
+        """A product's newest `window` prices, read off the (product_id, timestamp) index"""
+        return select(db.PriceRecord.timestamp, db.PriceRecord.price).where(
+            db.PriceRecord.product_id == product_id
+        ).order_by(db.PriceRecord.timestamp.desc()).limit(window)
+
+    def _aggregate_latest(self, latest, *group_by):
+        """Aggregate limited (timestamp, price) rows, lead only sees those rows"""
+        newest_first = latest.c.timestamp.desc()
+        partition_by = list(group_by) or None
+        ranked = select(
+            *group_by,
+            latest.c.price,
+            func.row_number().over(
+                partition_by=partition_by, order_by=newest_first
+            ).label('rn'),
+            func.lead(latest.c.price).over(
+                partition_by=partition_by, order_by=newest_first
+            ).label('prev_price')
+        ).subquery()
+        group_columns = [ranked.c[column.name] for column in group_by]
+
+        return select(
+            *group_columns,
+            func.max(case((ranked.c.rn == 1, ranked.c.price))).label('current_price'),
+            func.max(case((ranked.c.rn == 1, ranked.c.prev_price))).label('prev_price'),
+            func.avg(ranked.c.price).label('average_price'),
+            func.min(ranked.c.price).label('min_price'),
+            func.max(ranked.c.price).label('max_price')
+        ).group_by(*group_columns)
+
+    def _statistics_query(self, product: str, window: int = 30):
+        """Build a query aggregating a product's latest `window` prices"""
+        product_id = select(db.Product.id).where(db.Product.name == product).scalar_subquery()
+        return self._aggregate_latest(self._latest_prices(product_id, window).subquery())
+
+    def _all_statistics_query(self, window: int = 30):
+        """Build a query aggregating the latest `window` prices of every product
+
+        The LATERAL join keeps each product to one bounded index range (PostgreSQL).
+        """
+        latest = self._latest_prices(db.Product.id, window).lateral()
+        rows = select(db.Product.name, latest.c.timestamp, latest.c.price).select_from(
+            db.Product
+        ).join(latest, true()).subquery()
+        return self._aggregate_latest(rows, rows.c.name)
+
+    def _format_statistics(self, row) -> dict:
+        """Round an aggregated statistics row into the result dict"""
+        current_price = float(row.current_price)
+        prev_price = row.prev_price
+
+        # Calculate price change from previous day
+        if prev_price:
+            price_change = ((current_price - float(prev_price)) / float(prev_price)) * 100
+        else:
+            price_change = 0.0
+
+        return {
+            'current_price': round(current_price, 2),
+            'average_price': round(float(row.average_price), 2),
+            'price_change': round(price_change, 1),
+            'min_price': round(float(row.min_price), 2),
+            'max_price': round(float(row.max_price), 2)
+        }
+
     def get_price_statistics(self, product: str) -> dict:
         """Calculate price statistics for a product"""
         try:
-            # Get all price records for the product
-            records = self.db.query(db.PriceRecord).join(db.Product).filter(
-                db.Product.name == product
-            ).order_by(db.PriceRecord.timestamp.desc()).all()
+            with db.session_scope() as session:
+                row = session.execute(self._statistics_query(product)).first()
 
-            if not records:
+            if row is None or row.current_price is None:
                 print(f"No price records found for {product}")
-                return {
-                    'current_price': 0.0,
-                    'average_price': 0.0,
-                    'price_change': 0.0,
-                    'min_price': 0.0,
-                    'max_price': 0.0
-                }
-
-            # Calculate statistics
-            current_price = float(records[0].price)
-            prices = [float(record.price) for record in records[:30]]  # Last 30 days
-
-            if not prices:
-                return {
-                    'current_price': 0.0,
-                    'average_price': 0.0,
-                    'price_change': 0.0,
-                    'min_price': 0.0,
-                    'max_price': 0.0
-                }
-
-            avg_price = sum(prices) / len(prices)
-            min_price = min(prices)
-            max_price = max(prices)
-
-            # Calculate price change from previous day
-            if len(prices) > 1:
-                prev_price = prices[1]  # Yesterday's price
-                price_change = ((current_price - prev_price) / prev_price) * 100
-            else:
-                price_change = 0.0
-
-            return {
-                'current_price': round(current_price, 2),
-                'average_price': round(avg_price, 2),
-                'price_change': round(price_change, 1),
-                'min_price': round(min_price, 2),
-                'max_price': round(max_price, 2)
-            }
+                return dict(EMPTY_STATISTICS)
+
+            return self._format_statistics(row)
+        except Exception as e:
+            print(f"Error calculating price statistics: {str(e)}")
+            return dict(EMPTY_STATISTICS)
+
+    def get_all_price_statistics(self) -> dict:
+        """Calculate price statistics for every product, in one query on PostgreSQL"""
+        try:
+            with db.session_scope() as session:
+                if session.get_bind().dialect.name == 'postgresql':
+                    rows = session.execute(self._all_statistics_query()).all()
+                    return {row.name: self._format_statistics(row) for row in rows}
+
+                # No LATERAL, run the bounded per-product query for each product
+                statistics = {}
+                for product in session.execute(select(db.Product.name)).scalars().all():
+                    row = session.execute(self._statistics_query(product)).first()
+                    if row is not None and row.current_price is not None:
+                        statistics[product] = self._format_statistics(row)
+            return statistics
         except Exception as e:
             print(f"Error calculating price statistics: {str(e)}")
-            return {
-                'current_price': 0.0,
-                'average_price': 0.0,
-                'price_change': 0.0,
-                'min_price': 0.0,
-                'max_price': 0.0
-            }
\ No newline at end of file
+            return {}
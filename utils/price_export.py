@@ -0,0 +1,191 @@
+"""Export price history to per-product Arrow IPC or Parquet files
+
+Usage: python -m utils.price_export OUT_DIR [--format arrow] [--products Rice Corn]
+
+Files are laid out as OUT_DIR/product=<name>/prices.<arrow|parquet>. Point
+PRICE_ARROW_DIR at an Arrow export to serve history reads from memory-mapped
+files instead of the database.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from urllib.parse import quote
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from . import database as db
+from . import price_history
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pc = pq = None
+
+PRICE_ARROW_DIR = os.environ.get('PRICE_ARROW_DIR')
+EXPORT_CHUNKSIZE = 500_000
+FILE_NAMES = {'arrow': 'prices.arrow', 'parquet': 'prices.parquet'}
+if pa is not None:
+    TIMESTAMP_TYPE = pa.timestamp('us')
+    PRICE_SCHEMA = pa.schema([
+        ('timestamp', TIMESTAMP_TYPE),
+        ('price', pa.float64())
+    ])
+
+_store = None
+_store_lock = threading.Lock()
+
+def product_path(directory: str, product: str, file_format: str = 'arrow') -> str:
+    """Path of a product's export file, hive-style partitioned by product"""
+    return os.path.join(directory, f"product={quote(product, safe='')}", FILE_NAMES[file_format])
+
+def _record_batches(session, product: str, chunksize: int = EXPORT_CHUNKSIZE):
+    """Stream a product's full history as Arrow record batches, oldest first"""
+    query = price_history._history_query([product]).order_by(db.PriceRecord.timestamp)
+    # Server-side cursor on PostgreSQL, so memory stays bounded by chunksize
+    connection = session.connection().execution_options(stream_results=True)
+    for chunk in pd.read_sql(query, connection, chunksize=chunksize,
+                             dtype=price_history.PRICE_DTYPES, parse_dates=['timestamp']):
+        yield pa.RecordBatch.from_pandas(chunk, schema=PRICE_SCHEMA, preserve_index=False)
+
+def export_product(session, directory: str, product: str,
+                   file_format: str = 'arrow') -> int:
+    """Write one product's history to its export file, returns row count"""
+    path = product_path(directory, product, file_format)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write next to the target and swap in, readers keep their old mapping
+    partial = f"{path}.partial"
+
+    rows = 0
+    if file_format == 'arrow':
+        with pa.OSFile(partial, 'wb') as sink, pa.ipc.new_file(sink, PRICE_SCHEMA) as writer:
+            for batch in _record_batches(session, product):
+                writer.write_batch(batch)
+                rows += batch.num_rows
+    else:
+        with pq.ParquetWriter(partial, PRICE_SCHEMA) as writer:
+            for batch in _record_batches(session, product):
+                writer.write_batch(batch)
+                rows += batch.num_rows
+
+    os.replace(partial, path)
+    return rows
+
+def export_price_history(directory: str, products: list = None,
+                         file_format: str = 'arrow', verbose: bool = True) -> dict:
+    """Export every (or the given) product's history, returns rows per product"""
+    if pa is None:
+        raise ImportError("pyarrow is not installed")
+    with db.session_scope() as session:
+        if products is None:
+            products = session.execute(
+                select(db.Product.name).order_by(db.Product.name)
+            ).scalars().all()
+
+        exported = {}
+        for product in products:
+            began = time.perf_counter()
+            exported[product] = export_product(session, directory, product, file_format)
+            if verbose:
+                print(f"{product}: {exported[product]:,} rows in "
+                      f"{time.perf_counter() - began:.2f}s")
+    return exported
+
+class ArrowPriceStore:
+    """Read-only price history served from memory-mapped Arrow export files"""
+
+    def __init__(self, directory: str):
+        if pa is None:
+            raise ImportError("pyarrow is not installed")
+        self.directory = directory
+        self._tables = {}  # path -> (mtime, table)
+        self._lock = threading.Lock()
+
+    def _table(self, product: str) -> 'pa.Table':
+        """Memory-mapped table for a product, reopened when the file is replaced"""
+        path = product_path(self.directory, product)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+        with self._lock:
+            cached = self._tables.get(path)
+            if cached is None or cached[0] != mtime:
+                # Zero-copy: column buffers point straight into the mapped file
+                with pa.memory_map(path, 'r') as source:
+                    table = pa.ipc.open_file(source).read_all()
+                cached = (mtime, table)
+                self._tables[path] = cached
+            return cached[1]
+
+    def load(self, product: str, start_date=None, end_date=None,
+             limit: int = None, descending: bool = False) -> pd.DataFrame:
+        """Same (timestamp, price) frame as price_history.load_price_history
+
+        Returns None when the product has no export, so callers can fall back
+        to the database.
+        """
+        table = self._table(product)
+        if table is None:
+            return None
+
+        mask = None
+        if start_date is not None:
+            mask = pc.greater_equal(
+                table['timestamp'], pa.scalar(pd.Timestamp(start_date), TIMESTAMP_TYPE)
+            )
+        if end_date is not None:
+            upper = pc.less_equal(
+                table['timestamp'], pa.scalar(pd.Timestamp(end_date), TIMESTAMP_TYPE)
+            )
+            mask = upper if mask is None else pc.and_(mask, upper)
+        if mask is not None:
+            table = table.filter(mask)
+
+        # Exports are written oldest first
+        if descending:
+            if limit is not None:
+                table = table.slice(max(0, table.num_rows - limit))
+            table = table.take(np.arange(table.num_rows - 1, -1, -1))
+        elif limit is not None:
+            table = table.slice(0, limit)
+
+        df = table.to_pandas()
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        return df
+
+def arrow_store() -> ArrowPriceStore:
+    """Process-wide store for PRICE_ARROW_DIR, or None when not configured"""
+    global _store
+    if not PRICE_ARROW_DIR:
+        return None
+    with _store_lock:
+        if _store is None:
+            try:
+                _store = ArrowPriceStore(PRICE_ARROW_DIR)
+            except ImportError as e:
+                print(f"Error loading Arrow price store, using database: {str(e)}")
+                return None
+        return _store
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory')
+    parser.add_argument('--format', choices=list(FILE_NAMES), default='arrow')
+    parser.add_argument('--products', nargs='+')
+    args = parser.parse_args()
+
+    try:
+        exported = export_price_history(args.directory, args.products, args.format)
+    except ImportError as e:
+        print(f"Error exporting prices: {str(e)}")
+        sys.exit(1)
+    print(f"Exported {sum(exported.values()):,} rows for {len(exported)} products "
+          f"to {args.directory}")
+
+if __name__ == '__main__':
+    main()
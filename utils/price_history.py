@@ -0,0 +1,56 @@
+import pandas as pd
+from sqlalchemy import select
+from . import database as db
+
+PRICE_DTYPES = {'price': 'float64'}
+
+def _history_query(products, start_date=None, end_date=None,
+                   include_product: bool = False):
+    """Build a Core select of (timestamp, price) rows for products"""
+    columns = [db.PriceRecord.timestamp, db.PriceRecord.price]
+    if include_product:
+        columns.insert(0, db.Product.name.label('product'))
+
+    query = select(*columns).join(
+        db.Product, db.PriceRecord.product_id == db.Product.id
+    ).where(db.Product.name.in_(list(products)))
+
+    if start_date is not None:
+        query = query.where(db.PriceRecord.timestamp >= start_date)
+    if end_date is not None:
+        query = query.where(db.PriceRecord.timestamp <= end_date)
+    return query
+
+def _read_frame(session, query) -> pd.DataFrame:
+    """Read a query straight into a typed DataFrame, no ORM objects"""
+    df = pd.read_sql(
+        query,
+        session.connection(),
+        dtype=PRICE_DTYPES,
+        parse_dates=['timestamp']
+    )
+    if df.empty:
+        # Keep column dtypes stable for callers that do .dt or arithmetic
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    return df
+
+def load_price_history(session, product: str, start_date=None, end_date=None,
+                       limit: int = None, descending: bool = False) -> pd.DataFrame:
+    """Load a product's (timestamp, price) history as a DataFrame"""
+    query = _history_query([product], start_date, end_date)
+    order = db.PriceRecord.timestamp.desc() if descending else db.PriceRecord.timestamp
+    query = query.order_by(order)
+    if limit is not None:
+        query = query.limit(limit)
+    return _read_frame(session, query)
+
+def load_price_histories(session, products: list, start_date=None,
+                         end_date=None) -> dict:
+    """Load (timestamp, price) histories for several products in one query"""
+    query = _history_query(products, start_date, end_date, include_product=True)
+    query = query.order_by(db.Product.name, db.PriceRecord.timestamp)
+    df = _read_frame(session, query)
+    return {
+        name: group.drop(columns='product').reset_index(drop=True)
+        for name, group in df.groupby('product', sort=False)
+    }
@@ -0,0 +1,224 @@
+"""Stream a date,product,price CSV dump into price_records
+
+Usage: python -m utils.price_ingest PATH [PATH ...] [--chunksize 100000] [--method auto]
+       python -m utils.price_ingest --deduplicate
+
+Re-running a file is safe: rows are upserted on (product, timestamp).
+--deduplicate removes duplicate rows left by older versions, which block
+the unique index upserts rely on.
+"""
+import argparse
+import csv
+import io
+import sys
+import time
+import pandas as pd
+from sqlalchemy import func, insert, select, text
+from . import database as db
+from . import price_rollups
+
+CSV_COLUMNS = ['date', 'product', 'price']
+DEFAULT_CHUNKSIZE = 100_000
+
+def read_chunks(path: str, chunksize: int = DEFAULT_CHUNKSIZE):
+    """Yield cleaned (timestamp, product, price) frames without loading the whole file"""
+    reader = pd.read_csv(
+        path,
+        usecols=CSV_COLUMNS,
+        dtype={'product': 'string', 'price': 'float64'},
+        parse_dates=['date'],
+        chunksize=chunksize
+    )
+    for chunk in reader:
+        chunk = chunk.rename(columns={'date': 'timestamp'})
+        chunk['product'] = chunk['product'].str.strip()
+        chunk = chunk.dropna(subset=['timestamp', 'product', 'price'])
+        # A statement may only touch each (product, timestamp) once
+        yield chunk.drop_duplicates(subset=['product', 'timestamp'], keep='last')
+
+def resolve_products(session, names, product_ids: dict) -> dict:
+    """Extend the name -> id map with names not seen yet, creating missing products"""
+    unseen = [name for name in set(names) if name not in product_ids]
+    if not unseen:
+        return product_ids
+
+    product_ids.update(session.execute(
+        select(db.Product.name, db.Product.id).where(db.Product.name.in_(unseen))
+    ).all())
+    missing = [name for name in unseen if name not in product_ids]
+    if missing:
+        session.execute(insert(db.Product), [{'name': name} for name in missing])
+        product_ids.update(session.execute(
+            select(db.Product.name, db.Product.id).where(db.Product.name.in_(missing))
+        ).all())
+    return product_ids
+
+def _upsert_rows(session, rows: list) -> None:
+    """Bulk insert rows, replacing the price of existing (product, timestamp) rows"""
+    # check_upsert_index has rejected dialects without upserts
+    stmt = db.UPSERT_DIALECTS[session.get_bind().dialect.name](db.PriceRecord)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['product_id', 'timestamp'],
+        set_={'price': stmt.excluded.price}
+    )
+    session.execute(stmt, rows)
+
+def _copy_rows(session, frame: pd.DataFrame) -> None:
+    """COPY rows into a staging table, then upsert them in one statement"""
+    buffer = io.StringIO()
+    frame[['product_id', 'timestamp', 'price']].to_csv(
+        buffer, index=False, header=False, date_format='%Y-%m-%d %H:%M:%S.%f',
+        quoting=csv.QUOTE_MINIMAL
+    )
+    buffer.seek(0)
+
+    connection = session.connection()
+    connection.execute(text("""
+        CREATE TEMP TABLE IF NOT EXISTS price_records_staging (
+            product_id INTEGER, "timestamp" TIMESTAMP, price DOUBLE PRECISION
+        ) ON COMMIT DELETE ROWS
+    """))
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(
+            "COPY price_records_staging (product_id, \"timestamp\", price) "
+            "FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+    finally:
+        cursor.close()
+    connection.execute(text("""
+        INSERT INTO price_records (product_id, "timestamp", price)
+        SELECT product_id, "timestamp", price FROM price_records_staging
+        ON CONFLICT (product_id, "timestamp") DO UPDATE SET price = EXCLUDED.price
+    """))
+
+def _use_copy(session, method: str) -> bool:
+    if method == 'auto':
+        dialect = session.get_bind().dialect
+        return dialect.name == 'postgresql' and dialect.driver == 'psycopg2'
+    return method == 'copy'
+
+def check_upsert_index(bind=None) -> None:
+    """Fail before loading anything if upserts have no unique index to target"""
+    bind = bind or db.init_db()
+    if bind.dialect.name not in db.UPSERT_DIALECTS:
+        raise ValueError(
+            f"Price ingestion upserts rows, which is not supported on {bind.dialect.name}, "
+            f"use PostgreSQL or SQLite"
+        )
+    if not db.has_unique_index(bind, db.PriceRecord.__tablename__, ['product_id', 'timestamp']):
+        raise ValueError(
+            "price_records has no unique (product_id, timestamp) index, so re-runs "
+            "cannot upsert. Run python -m utils.price_ingest --deduplicate to remove "
+            "the duplicate rows blocking it."
+        )
+
+def deduplicate_prices(verbose: bool = True) -> int:
+    """Keep the newest row per (product, timestamp), then build the unique index
+
+    Rollups of the affected days are rebuilt. Returns the number of rows removed.
+    """
+    bind = db.init_db()
+    with db.session_scope() as session:
+        duplicated = session.execute(
+            select(db.PriceRecord.product_id, db.PriceRecord.timestamp).where(
+                db.PriceRecord.product_id.is_not(None),
+                db.PriceRecord.timestamp.is_not(None)
+            ).group_by(
+                db.PriceRecord.product_id, db.PriceRecord.timestamp
+            ).having(func.count() > 1)
+        )
+        touched = {}  # product_id -> days holding duplicates
+        for product_id, timestamp in duplicated:
+            touched.setdefault(product_id, set()).add(pd.Timestamp(timestamp).floor('D'))
+
+        deleted = db._deduplicate(
+            session.connection(), db.PriceRecord.__tablename__, ['product_id', 'timestamp']
+        )
+        for product_id, days in touched.items():
+            price_rollups.rebuild_days(session, product_id, days)
+
+    db.migrate(bind)
+    if verbose:
+        print(f"Removed {deleted:,} duplicate price rows across {len(touched)} products")
+    return deleted
+
+def ingest_csv(path: str, chunksize: int = DEFAULT_CHUNKSIZE,
+               method: str = 'auto', verbose: bool = True) -> dict:
+    """Load a price CSV chunk by chunk, one transaction per chunk, returns stats"""
+    check_upsert_index()
+
+    product_ids = {}
+    touched = {}  # product_id -> days written, for rollups
+    rows_written = 0
+    began = time.perf_counter()
+
+    for chunk in read_chunks(path, chunksize):
+        if chunk.empty:
+            continue
+        with db.session_scope() as session:
+            resolve_products(session, chunk['product'].unique(), product_ids)
+            chunk['product_id'] = chunk['product'].map(product_ids).astype('int64')
+
+            db.ensure_price_partitions(
+                chunk['timestamp'].min(), chunk['timestamp'].max(),
+                bind=session.connection()
+            )
+            if _use_copy(session, method):
+                _copy_rows(session, chunk)
+            else:
+                _upsert_rows(session, [
+                    {'product_id': int(pid), 'timestamp': ts.to_pydatetime(), 'price': float(price)}
+                    for pid, ts, price in zip(chunk['product_id'], chunk['timestamp'], chunk['price'])
+                ])
+
+        days = chunk[['product_id']].assign(day=chunk['timestamp'].dt.floor('D')).drop_duplicates()
+        for product_id, day in zip(days['product_id'], days['day']):
+            touched.setdefault(int(product_id), set()).add(day)
+
+        rows_written += len(chunk)
+        if verbose:
+            elapsed = time.perf_counter() - began
+            print(f"{path}: {rows_written:,} rows, {rows_written / elapsed:,.0f} rows/s")
+
+    # Rebuild rather than fold in, so re-runs do not double count
+    for product_id, days in touched.items():
+        with db.session_scope() as session:
+            price_rollups.rebuild_days(session, product_id, days)
+
+    elapsed = time.perf_counter() - began
+    stats = {
+        'rows': rows_written,
+        'products': len(touched),
+        'seconds': round(elapsed, 2),
+        'rows_per_second': round(rows_written / elapsed) if elapsed > 0 else 0
+    }
+    if verbose:
+        print(f"{path}: done, {stats['rows']:,} rows for {stats['products']} products "
+              f"in {stats['seconds']}s ({stats['rows_per_second']:,} rows/s)")
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('paths', nargs='*')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument('--method', choices=['auto', 'insert', 'copy'], default='auto',
+                        help="copy uses PostgreSQL COPY via a staging table")
+    parser.add_argument('--deduplicate', action='store_true',
+                        help="remove duplicate (product, timestamp) rows before ingesting")
+    args = parser.parse_args()
+    if not args.paths and not args.deduplicate:
+        parser.error("give at least one PATH or --deduplicate")
+
+    try:
+        if args.deduplicate:
+            deduplicate_prices()
+        for path in args.paths:
+            ingest_csv(path, args.chunksize, args.method)
+    except ValueError as e:
+        print(f"Error ingesting prices: {str(e)}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
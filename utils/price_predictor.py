@@ -1,48 +1,217 @@
+import threading
 import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from sklearn.linear_model import LinearRegression
+from sqlalchemy import func
 from statsmodels.tsa.holtwinters import ExponentialSmoothing
 from . import database as db
+from . import price_export
+from . import price_history
+from . import price_rollups
+from .cache import TTLCache
+from .model_store import ModelStore
+from .online_forecaster import OnlineHoltWinters
+
+# Days of history the forecast models are fitted on
+HISTORY_DAYS = 90
+FEATURE_COLUMNS = ['day_of_week', 'month', 'trend']
+
+def _build_holt_winters(y: np.ndarray) -> ExponentialSmoothing:
+    """Build the additive weekly Holt-Winters model used for forecasts"""
+    return ExponentialSmoothing(
+        y,
+        seasonal_periods=7,
+        trend='add',
+        seasonal='add'
+    )
+
+def _holt_winters_params(hw_model) -> dict:
+    """Serialize fitted Holt-Winters parameters in start_params order"""
+    params = hw_model.params
+    start_params = [
+        params['smoothing_level'],
+        params['smoothing_trend'],
+        params['smoothing_seasonal'],
+        params['initial_level'],
+        params['initial_trend']
+    ] + list(params['initial_seasons'])
+    return {'start_params': [float(value) for value in start_params]}
+
+def _fit_holt_winters(y: np.ndarray, days_ahead: int):
+    """Fit Holt-Winters on one series and forecast, run in pool workers"""
+    try:
+        hw_model = _build_holt_winters(y).fit()
+        return np.asarray(hw_model.forecast(days_ahead))
+    except Exception as e:
+        print(f"Error fitting Holt-Winters model: {str(e)}")
+        return None
+
+def _fit_linear_batch(X: np.ndarray, y: np.ndarray, groups: np.ndarray,
+                      n_groups: int) -> tuple:
+    """Fit one least-squares model per group from stacked design matrices"""
+    # Add intercept column and accumulate per-group normal equations
+    X1 = np.column_stack([np.ones(len(X)), X])
+    XtX = np.zeros((n_groups, X1.shape[1], X1.shape[1]))
+    Xty = np.zeros((n_groups, X1.shape[1]))
+    np.add.at(XtX, groups, np.einsum('ni,nj->nij', X1, X1))
+    np.add.at(Xty, groups, X1 * y[:, None])
+
+    # Pseudo-inverse handles rank-deficient groups (e.g. a single month)
+    coef = np.einsum('gij,gj->gi', np.linalg.pinv(XtX), Xty)
+
+    # R^2 per group, matching LinearRegression.score
+    fitted = np.einsum('ni,ni->n', X1, coef[groups])
+    counts = np.bincount(groups, minlength=n_groups)
+    means = np.bincount(groups, weights=y, minlength=n_groups) / np.maximum(counts, 1)
+    ss_res = np.bincount(groups, weights=(y - fitted) ** 2, minlength=n_groups)
+    ss_tot = np.bincount(groups, weights=(y - means[groups]) ** 2, minlength=n_groups)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r2 = np.where(ss_tot > 0, 1 - ss_res / ss_tot, 0.0)
+    return coef, r2
 
 class PricePredictor:
-    def __init__(self):
-        self.db = next(db.get_db())
+    def __init__(self, max_workers: int = None, cache_size: int = 256,
+                 cache_ttl: float = 600, warm_start_max_new: int = 14):
         self.last_update = {}
         self.update_interval = 300  # 5 minutes in seconds
+        self.max_workers = max_workers
+        self.forecast_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.model_store = ModelStore()  # Opens a short session per load/save
+        self.warm_start_max_new = warm_start_max_new  # New rows allowed for warm refits
+        self.online_models = {}
+        # One predictor serves every session, guard the per-product state
+        self._lock = threading.Lock()
 
-    def _get_historical_data(self, product: str, days: int = 90) -> pd.DataFrame:
+    def _get_historical_data(self, product: str, days: int = HISTORY_DAYS) -> pd.DataFrame:
         """Get historical price data for prediction"""
         try:
             end_date = datetime.now()
             start_date = end_date - timedelta(days=days)
-            
-            records = self.db.query(db.PriceRecord).join(db.Product).filter(
-                db.Product.name == product,
-                db.PriceRecord.timestamp >= start_date
-            ).order_by(db.PriceRecord.timestamp).all()
-            
-            data = [{
-                'timestamp': record.timestamp,
-                'price': float(record.price)
-            } for record in records]
-            
-            return pd.DataFrame(data)
+
+            # Memory-mapped export when configured, the database otherwise
+            store = price_export.arrow_store()
+            df = store.load(product, start_date=start_date) if store else None
+            if df is not None:
+                return df
+
+            with db.session_scope() as session:
+                return price_history.load_price_history(
+                    session, product, start_date=start_date
+                )
         except Exception as e:
             print(f"Error getting historical data: {str(e)}")
             return pd.DataFrame()
 
+    def _get_historical_data_bulk(self, products: list, days: int = HISTORY_DAYS) -> dict:
+        """Get historical price data for several products in one query"""
+        try:
+            start_date = datetime.now() - timedelta(days=days)
+            histories, missing = {}, []
+            store = price_export.arrow_store()
+            for product in products:
+                df = store.load(product, start_date=start_date) if store else None
+                if df is None:
+                    missing.append(product)
+                elif not df.empty:
+                    histories[product] = df
+
+            if missing:
+                with db.session_scope() as session:
+                    histories.update(price_history.load_price_histories(
+                        session, missing, start_date=start_date
+                    ))
+            return histories
+        except Exception as e:
+            print(f"Error getting historical data: {str(e)}")
+            return {}
+
     def _prepare_features(self, df: pd.DataFrame) -> tuple:
         """Prepare features for prediction"""
         df['day_of_week'] = df['timestamp'].dt.dayofweek
         df['month'] = df['timestamp'].dt.month
         df['trend'] = np.arange(len(df))
         
-        X = df[['day_of_week', 'month', 'trend']].values
+        X = df[FEATURE_COLUMNS].values
         y = df['price'].values
         return X, y
 
+    def _data_version(self, product: str, days: int = HISTORY_DAYS) -> tuple:
+        """Get (row count, latest timestamp) of the window a forecast is fitted on"""
+        # Same window as _get_historical_data, so the count stays index-bounded
+        start_date = datetime.now() - timedelta(days=days)
+        with db.session_scope() as session:
+            return tuple(session.query(
+                func.count(db.PriceRecord.id), func.max(db.PriceRecord.timestamp)
+            ).join(db.Product).filter(
+                db.Product.name == product,
+                db.PriceRecord.timestamp >= start_date
+            ).one())
+
     def predict_price(self, product: str, days_ahead: int = 7) -> dict:
+        """Predict future prices, reusing cached forecasts while data is unchanged"""
+        try:
+            key = (product, days_ahead, self._data_version(product))
+        except Exception as e:
+            print(f"Error reading price data version: {str(e)}")
+            return self._predict_price(product, days_ahead)
+
+        cached = self.forecast_cache.get(key)
+        if cached is not None:
+            return cached
+
+        result = self._predict_price(product, days_ahead)
+        if result['forecast']:
+            self.forecast_cache.set(key, result)
+        return result
+
+    def _linear_forecast(self, product: str, X: np.ndarray, y: np.ndarray,
+                         X_future: np.ndarray, last_date) -> tuple:
+        """Predict with stored regression coefficients, refitting on new data"""
+        state = self.model_store.load(product, 'linear')
+        if state and state['n_obs'] == len(y) and state['last_timestamp'] == last_date:
+            params = state['params']
+            predictions = X_future @ np.array(params['coef']) + params['intercept']
+            return predictions, float(params['score'])
+
+        model = LinearRegression()
+        model.fit(X, y)
+        score = float(model.score(X, y))
+        self.model_store.save(product, 'linear', {
+            'coef': [float(value) for value in model.coef_],
+            'intercept': float(model.intercept_),
+            'score': score
+        }, len(y), pd.Timestamp(last_date).to_pydatetime())
+        return model.predict(X_future), score
+
+    def _fit_holt_winters_warm(self, product: str, df: pd.DataFrame, y: np.ndarray):
+        """Fit Holt-Winters, warm-starting from stored parameters when possible"""
+        state = self.model_store.load(product, 'holt_winters')
+        hw_model = None
+
+        if state and state['last_timestamp'] is not None:
+            n_new = int((df['timestamp'] > state['last_timestamp']).sum())
+            if n_new <= self.warm_start_max_new:
+                try:
+                    # Skip the brute-force grid search, start from the last optimum
+                    hw_model = _build_holt_winters(y).fit(
+                        start_params=state['params']['start_params'],
+                        use_brute=False
+                    )
+                except Exception as e:
+                    print(f"Warm start failed, refitting from scratch: {str(e)}")
+
+        if hw_model is None:
+            hw_model = _build_holt_winters(y).fit()
+
+        self.model_store.save(
+            product, 'holt_winters', _holt_winters_params(hw_model),
+            len(y), df['timestamp'].max().to_pydatetime()
+        )
+        return hw_model
+
+    def _predict_price(self, product: str, days_ahead: int = 7) -> dict:
         """Predict future prices using multiple models"""
         try:
             # Get historical data
@@ -57,10 +226,6 @@ class PricePredictor:
             # Prepare data for prediction
             X, y = self._prepare_features(df)
             
-            # Linear regression for trend
-            model = LinearRegression()
-            model.fit(X, y)
-            
             # Generate future dates
             last_date = df['timestamp'].max()
             future_dates = pd.date_range(
@@ -75,24 +240,20 @@ class PricePredictor:
             future_df['month'] = future_df['timestamp'].dt.month
             future_df['trend'] = np.arange(len(df), len(df) + len(future_df))
             
-            # Make predictions
-            X_future = future_df[['day_of_week', 'month', 'trend']].values
-            lr_predictions = model.predict(X_future)
+            # Linear regression for trend, reused as-is when no data changed
+            X_future = future_df[FEATURE_COLUMNS].values
+            lr_predictions, confidence = self._linear_forecast(
+                product, X, y, X_future, last_date
+            )
             
             # Exponential smoothing for short-term predictions
-            hw_model = ExponentialSmoothing(
-                y,
-                seasonal_periods=7,
-                trend='add',
-                seasonal='add'
-            ).fit()
+            hw_model = self._fit_holt_winters_warm(product, df, y)
             hw_predictions = hw_model.forecast(days_ahead)
             
             # Combine predictions
             final_predictions = (lr_predictions + hw_predictions) / 2
             
-            # Calculate confidence and trend
-            confidence = float(model.score(X, y))
+            # Calculate trend
             recent_trend = np.mean(np.diff(y[-7:]))
             
             trend_direction = 'up' if recent_trend > 0.01 else \
@@ -118,37 +279,130 @@ class PricePredictor:
                 'trend': 'stable'
             }
 
+    def predict_prices(self, products: list, days_ahead: int = 7) -> dict:
+        """Predict future prices for many products in one batch"""
+        results = {
+            product: {'forecast': [], 'confidence': 0.0, 'trend': 'stable'}
+            for product in products
+        }
+        try:
+            histories = self._get_historical_data_bulk(products)
+            names = [product for product in products if product in histories]
+            if not names:
+                return results
+
+            # Stack every product's design matrix with a group index
+            frames, groups = [], []
+            for idx, name in enumerate(names):
+                X, y = self._prepare_features(histories[name])
+                frames.append((X, y))
+                groups.append(np.full(len(y), idx))
+            X_all = np.vstack([X for X, _ in frames]).astype(float)
+            y_all = np.concatenate([y for _, y in frames]).astype(float)
+            groups = np.concatenate(groups)
+
+            coef, r2 = _fit_linear_batch(X_all, y_all, groups, len(names))
+
+            # Holt-Winters fits are independent, fan them out across processes
+            series = [y for _, y in frames]
+            if len(series) > 1:
+                with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+                    hw_forecasts = list(pool.map(
+                        _fit_holt_winters, series, [days_ahead] * len(series)
+                    ))
+            else:
+                hw_forecasts = [_fit_holt_winters(series[0], days_ahead)]
+
+            for idx, name in enumerate(names):
+                hw_predictions = hw_forecasts[idx]
+                if hw_predictions is None:
+                    continue
+
+                df = histories[name]
+                last_date = df['timestamp'].max()
+                future_dates = pd.date_range(
+                    start=last_date + timedelta(days=1),
+                    periods=days_ahead,
+                    freq='D'
+                )
+                X_future = np.column_stack([
+                    np.ones(days_ahead),
+                    future_dates.dayofweek,
+                    future_dates.month,
+                    np.arange(len(df), len(df) + days_ahead)
+                ])
+                lr_predictions = X_future @ coef[idx]
+
+                final_predictions = (lr_predictions + hw_predictions) / 2
+
+                y = frames[idx][1]
+                recent_trend = np.mean(np.diff(y[-7:]))
+                trend_direction = 'up' if recent_trend > 0.01 else \
+                                'down' if recent_trend < -0.01 else 'stable'
+
+                results[name] = {
+                    'forecast': [{
+                        'date': date.strftime('%Y-%m-%d'),
+                        'price': float(round(price, 2))
+                    } for date, price in zip(future_dates, final_predictions)],
+                    'confidence': round(float(r2[idx]), 2),
+                    'trend': trend_direction
+                }
+
+            return results
+
+        except Exception as e:
+            print(f"Error in batch price prediction: {str(e)}")
+            return results
+
     def _update_real_time_price(self, product: str) -> float:
         """Update real-time price based on market factors"""
         try:
-            # Get current price
-            current_record = self.db.query(db.PriceRecord).join(db.Product).filter(
-                db.Product.name == product
-            ).order_by(db.PriceRecord.timestamp.desc()).first()
-            
-            if not current_record:
-                return 0.0
-            
-            current_price = float(current_record.price)
-            
-            # Simulate real-time factors (replace with actual market data in production)
-            time_factor = np.sin(datetime.now().hour / 24 * 2 * np.pi) * 0.002
-            random_factor = np.random.normal(0, 0.001)
-            
-            # Calculate new price
-            new_price = current_price * (1 + time_factor + random_factor)
-            
-            # Add new price record if enough time has passed
-            last_update = self.last_update.get(product, datetime.min)
-            if (datetime.now() - last_update).total_seconds() >= self.update_interval:
+            # Long-running servers outlive the partitions created at startup.
+            # Checked before the session reads price_records, as DDL on the
+            # parent table would wait on that session's lock.
+            db.ensure_partition_for(datetime.utcnow())
+
+            with db.session_scope() as session:
+                # Get current price
+                current_record = session.query(db.PriceRecord).join(db.Product).filter(
+                    db.Product.name == product
+                ).order_by(db.PriceRecord.timestamp.desc()).first()
+
+                if not current_record:
+                    return 0.0
+
+                current_price = float(current_record.price)
+
+                # Simulate real-time factors (replace with actual market data in production)
+                time_factor = np.sin(datetime.now().hour / 24 * 2 * np.pi) * 0.002
+                random_factor = np.random.normal(0, 0.001)
+
+                # Calculate new price
+                new_price = current_price * (1 + time_factor + random_factor)
+
+                # Add new price record if enough time has passed
+                if not self._claim_update(product):
+                    return float(round(new_price, 2))
+
                 new_record = db.PriceRecord(
                     product_id=current_record.product_id,
                     timestamp=datetime.utcnow(),
                     price=float(round(new_price, 2))
                 )
-                self.db.add(new_record)
-                self.db.commit()
-                self.last_update[product] = datetime.now()
+                session.add(new_record)
+                price_rollups.record_prices(
+                    session, new_record.product_id, [new_record.timestamp], [new_record.price]
+                )
+                session.commit()
+
+            # New data makes every cached forecast for this product stale
+            self.forecast_cache.invalidate(lambda key: key[0] == product)
+
+            with self._lock:
+                online_model = self.online_models.get(product)
+                if online_model is not None:
+                    online_model.update(float(round(new_price, 2)))
             
             return float(round(new_price, 2))
             
@@ -156,9 +410,40 @@ class PricePredictor:
             print(f"Error updating real-time price: {str(e)}")
             return 0.0
 
+    def _claim_update(self, product: str) -> bool:
+        """Reserve the next real-time insert for a product, once per interval"""
+        with self._lock:
+            last_update = self.last_update.get(product, datetime.min)
+            if (datetime.now() - last_update).total_seconds() < self.update_interval:
+                return False
+            self.last_update[product] = datetime.now()
+            return True
+
+    def _online_model(self, product: str) -> OnlineHoltWinters:
+        """Get the in-memory Holt-Winters state, bootstrapping it from history once"""
+        with self._lock:
+            model = self.online_models.get(product)
+        if model is not None:
+            return model
+
+        # Read history without the lock, it is shared by every session's updates
+        model = OnlineHoltWinters(
+            season_length=max(1, int(24 * 3600 / self.update_interval))
+        )
+        df = self._get_historical_data(product, days=1)
+        for price in df.get('price', []):
+            model.update(price)
+
+        with self._lock:
+            # Another session may have bootstrapped the product meanwhile
+            return self.online_models.setdefault(product, model)
+
     def get_real_time_price(self, product: str) -> dict:
         """Get real-time price and short-term prediction"""
         try:
+            # Bootstrap online state before any new record is folded into it
+            online_model = self._online_model(product)
+
             # Get updated price
             current_price = self._update_real_time_price(product)
             if current_price == 0.0:
@@ -168,11 +453,11 @@ class PricePredictor:
                     'update_time': datetime.now().strftime('%H:%M:%S')
                 }
             
-            # Short-term prediction
-            df = self._get_historical_data(product, days=1)
-            if not df.empty:
-                recent_trend = np.mean(np.diff(df['price'].values[-12:]))  # Last 12 records
-                next_hour = current_price * (1 + recent_trend)
+            # Short-term prediction from the online state, one hour of updates ahead
+            if online_model.n_obs > 1:
+                steps = max(1, int(3600 / self.update_interval))
+                with self._lock:
+                    next_hour = online_model.forecast(steps)
             else:
                 next_hour = current_price
             
@@ -0,0 +1,197 @@
+import pandas as pd
+from sqlalchemy import func, insert, select
+from . import database as db
+
+# Rollup resolutions from finest to coarsest, with pandas bucket frequency
+RESOLUTIONS = {'hour': 'h', 'day': 'D'}
+BUCKET_SIZES = {'hour': pd.Timedelta(hours=1), 'day': pd.Timedelta(days=1)}
+DEFAULT_MAX_POINTS = 2500
+REBUILD_WINDOW_DAYS = 31
+
+def _aggregate(df: pd.DataFrame, freq: str) -> pd.DataFrame:
+    """Aggregate (timestamp, price) rows into OHLC buckets"""
+    df = df.sort_values('timestamp')
+    grouped = df.groupby(df['timestamp'].dt.floor(freq))
+    return grouped.agg(
+        open=('price', 'first'),
+        high=('price', 'max'),
+        low=('price', 'min'),
+        close=('price', 'last'),
+        count=('price', 'size'),
+        first_timestamp=('timestamp', 'min'),
+        last_timestamp=('timestamp', 'max')
+    )
+
+def record_prices(session, product_id: int, timestamps, prices) -> None:
+    """Fold newly inserted price rows into the hourly and daily rollups"""
+    df = pd.DataFrame({
+        'timestamp': pd.to_datetime(pd.Series(list(timestamps))),
+        'price': pd.Series(list(prices), dtype='float64')
+    })
+    if df.empty:
+        return
+
+    for resolution, freq in RESOLUTIONS.items():
+        buckets = _aggregate(df, freq)
+        existing = {
+            rollup.bucket: rollup
+            for rollup in session.query(db.PriceRollup).filter(
+                db.PriceRollup.product_id == product_id,
+                db.PriceRollup.resolution == resolution,
+                db.PriceRollup.bucket.in_([b.to_pydatetime() for b in buckets.index])
+            )
+        }
+
+        new_rows = []
+        for bucket, row in buckets.iterrows():
+            bucket = bucket.to_pydatetime()
+            first_ts = row['first_timestamp'].to_pydatetime()
+            last_ts = row['last_timestamp'].to_pydatetime()
+            rollup = existing.get(bucket)
+
+            if rollup is None:
+                new_rows.append({
+                    'product_id': product_id,
+                    'resolution': resolution,
+                    'bucket': bucket,
+                    'open': float(row['open']),
+                    'high': float(row['high']),
+                    'low': float(row['low']),
+                    'close': float(row['close']),
+                    'count': int(row['count']),
+                    'first_timestamp': first_ts,
+                    'last_timestamp': last_ts
+                })
+                continue
+
+            # Merge into the stored bucket, tolerating out-of-order arrivals
+            rollup.high = max(rollup.high, float(row['high']))
+            rollup.low = min(rollup.low, float(row['low']))
+            rollup.count += int(row['count'])
+            if first_ts < rollup.first_timestamp:
+                rollup.open = float(row['open'])
+                rollup.first_timestamp = first_ts
+            if last_ts >= rollup.last_timestamp:
+                rollup.close = float(row['close'])
+                rollup.last_timestamp = last_ts
+
+        if new_rows:
+            session.execute(insert(db.PriceRollup), new_rows)
+
+    session.flush()
+
+def rebuild_rollups(session, product_id: int) -> None:
+    """Recompute a product's rollups from its raw price records"""
+    session.query(db.PriceRollup).filter(
+        db.PriceRollup.product_id == product_id
+    ).delete(synchronize_session=False)
+
+    df = pd.read_sql(
+        select(db.PriceRecord.timestamp, db.PriceRecord.price).where(
+            db.PriceRecord.product_id == product_id
+        ),
+        session.connection(),
+        parse_dates=['timestamp']
+    )
+    record_prices(session, product_id, df['timestamp'], df['price'])
+
+def _rebuild_window(session, product_id: int, start, end) -> None:
+    # Day buckets contain their hour buckets, so whole days rebuild both
+    session.query(db.PriceRollup).filter(
+        db.PriceRollup.product_id == product_id,
+        db.PriceRollup.bucket >= start,
+        db.PriceRollup.bucket < end
+    ).delete(synchronize_session=False)
+
+    df = pd.read_sql(
+        select(db.PriceRecord.timestamp, db.PriceRecord.price).where(
+            db.PriceRecord.product_id == product_id,
+            db.PriceRecord.timestamp >= start,
+            db.PriceRecord.timestamp < end
+        ),
+        session.connection(),
+        parse_dates=['timestamp']
+    )
+    record_prices(session, product_id, df['timestamp'], df['price'])
+
+def rebuild_range(session, product_id: int, start, end) -> None:
+    """Recompute a product's rollups for the whole days spanning [start, end]
+
+    Raw rows are read REBUILD_WINDOW_DAYS at a time, so long spans stay bounded
+    in memory.
+    """
+    start = pd.Timestamp(start).floor('D')
+    end = pd.Timestamp(end).floor('D') + pd.Timedelta(days=1)
+    window = pd.Timedelta(days=REBUILD_WINDOW_DAYS)
+    while start < end:
+        stop = min(start + window, end)
+        _rebuild_window(session, product_id, start.to_pydatetime(), stop.to_pydatetime())
+        start = stop
+
+def rebuild_days(session, product_id: int, days) -> None:
+    """Recompute a product's rollups for the given days, contiguous days together"""
+    days = sorted({pd.Timestamp(day).floor('D') for day in days})
+    if not days:
+        return
+
+    first = last = days[0]
+    for day in days[1:]:
+        if day - last > pd.Timedelta(days=1):
+            rebuild_range(session, product_id, first, last)
+            first = day
+        last = day
+    rebuild_range(session, product_id, first, last)
+
+def backfill_missing(session) -> list:
+    """Build rollups for products that have prices but no rollups yet"""
+    has_prices = select(db.PriceRecord.product_id).distinct()
+    has_rollups = select(db.PriceRollup.product_id).distinct()
+    product_ids = session.execute(
+        has_prices.except_(has_rollups)
+    ).scalars().all()
+
+    for product_id in product_ids:
+        rebuild_rollups(session, product_id)
+    session.commit()
+    return product_ids
+
+def choose_resolution(raw_points: int, start_date, end_date,
+                      max_points: int = DEFAULT_MAX_POINTS) -> str:
+    """Pick the finest resolution whose point count fits the budget"""
+    if raw_points <= max_points:
+        return 'raw'
+
+    window = pd.Timestamp(end_date) - pd.Timestamp(start_date)
+    for resolution in RESOLUTIONS:
+        if window / BUCKET_SIZES[resolution] <= max_points:
+            return resolution
+    return list(RESOLUTIONS)[-1]
+
+def count_raw_points(session, product: str, start_date, end_date) -> int:
+    """Count raw price rows for a product within a window"""
+    return session.execute(
+        select(func.count(db.PriceRecord.id)).join(
+            db.Product, db.PriceRecord.product_id == db.Product.id
+        ).where(
+            db.Product.name == product,
+            db.PriceRecord.timestamp >= start_date,
+            db.PriceRecord.timestamp <= end_date
+        )
+    ).scalar()
+
+def load_rollup_history(session, product: str, resolution: str,
+                        start_date, end_date) -> pd.DataFrame:
+    """Load a product's rollup closing prices as (timestamp, price)"""
+    query = select(
+        db.PriceRollup.bucket.label('timestamp'),
+        db.PriceRollup.close.label('price')
+    ).join(
+        db.Product, db.PriceRollup.product_id == db.Product.id
+    ).where(
+        db.Product.name == product,
+        db.PriceRollup.resolution == resolution,
+        db.PriceRollup.bucket >= pd.Timestamp(start_date).floor(RESOLUTIONS[resolution]).to_pydatetime(),
+        db.PriceRollup.bucket <= end_date
+    ).order_by(db.PriceRollup.bucket)
+
+    return pd.read_sql(query, session.connection(), parse_dates=['timestamp'])